@@ -0,0 +1,73 @@
+import asyncio
+import random
+import time
+from aiohttp import web
+
+
+# Локальная замена Telegram Bot API: отвечает на методы, которыми пользуется бот,
+# и запоминает все вызовы (метод, параметры, время получения)
+class FakeTelegramApi:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, flood_rate=0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency        # задержка ответа, сек
+        self.flood_rate = flood_rate  # доля запросов, на которые отвечаем 429
+        self.calls = []
+        self._message_id = 0
+        self._runner = None
+
+    @property
+    def api_url(self):
+        return f"http://{self.host}:{self.port}/bot{{0}}/{{1}}"
+
+    def _message(self, params):
+        self._message_id += 1
+        chat_id = int(params.get("chat_id", 0))
+        return {
+            "message_id": int(params.get("message_id", self._message_id)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private"},
+            "text": params.get("text", "")
+        }
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        self.calls.append((method, params, time.monotonic()))
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.flood_rate and random.random() < self.flood_rate:
+            return web.json_response({
+                "ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1}
+            })
+
+        if method in ("sendMessage", "sendDocument", "editMessageText", "editMessageReplyMarkup"):
+            result = self._message(params)
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def sent(self, method="sendMessage"):
+        return [(params, at) for name, params, at in self.calls if name == method]
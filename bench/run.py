@@ -0,0 +1,193 @@
+# Нагрузочный прогон бота против локального фейкового Bot API.
+# Запуск из корня репозитория: python -m bench.run --admins 20 --shifts 50
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from settings import settings
+
+ADMIN_BASE = 10_000_000
+CHAT_BASE = -1_000_000_000_000
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def message_update(update_id, user_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "text": text
+        }
+    }
+
+
+def callback_update(update_id, user_id, data):
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": "bench",
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "menu"
+            },
+            "data": data
+        }
+    }
+
+
+# Сценарий одного админа: добавить смену, посмотреть график, открыть и полистать меню
+def admin_session(user_id, index):
+    start = f"{index % 24:02d}:{index * 7 % 60:02d}"
+    return [
+        ("message", "/start"),
+        ("message", "Добавить смену"),
+        ("message", f"{start}-{(index + 1) % 24:02d}:00"),
+        ("message", f"@bench_user_{index}"),
+        ("message", "График"),
+        ("message", "Редактировать"),
+        ("callback", "page_edit_1"),
+        ("message", "Удалить"),
+        ("message", "Отмена"),
+    ]
+
+
+async def replay_sessions(main, admins, results):
+    from telebot import types
+
+    update_ids = iter(range(1, 10 ** 9))
+
+    async def run_admin(index):
+        user_id = ADMIN_BASE + index
+        for kind, payload in admin_session(user_id, index):
+            if kind == "message":
+                raw = message_update(next(update_ids), user_id, payload)
+            else:
+                raw = callback_update(next(update_ids), user_id, payload)
+            started = time.perf_counter()
+            await main.bot.process_new_updates([types.Update.de_json(raw)])
+            results.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_admin(i) for i in range(admins)))
+    return time.perf_counter() - started
+
+
+# Смены в разных группах стартуют через offset секунд; проверяем, все ли пинги пришли вовремя
+async def replay_schedule(main, api, shifts, spread, grace):
+    now = datetime.now()
+    planned = {}
+
+    # Вместо настоящего расписания смены стартуют в заданные моменты ближайших секунд
+    timeline = main.scheduler.timeline
+    real_next_after = timeline.next_after
+    timeline.next_after = lambda shift, at: (
+        (planned[shift["id"]], shift["username"]) if planned.get(shift["id"], at) > at
+        else real_next_after(shift, at)
+    )
+
+    for i in range(shifts):
+        shift = main.shift_repo.add(f"ping_user_{i}", "00:00", "23:59", CHAT_BASE - i, None)
+        planned[shift["id"]] = now + timedelta(seconds=1 + spread * i / max(shifts, 1))
+    main.scheduler.rebuild()
+
+    await asyncio.sleep(1 + spread + grace)
+
+    # Время получения пинга фейковым API -> опоздание относительно плана
+    wall_offset = datetime.now() - timedelta(seconds=time.monotonic())
+    received = {}
+    for params, at in api.sent():
+        if int(params.get("chat_id", 0)) < CHAT_BASE + 1:
+            chat_index = CHAT_BASE - int(params["chat_id"])
+            received.setdefault(chat_index, wall_offset + timedelta(seconds=at))
+
+    lateness = []
+    missed = 0
+    for i, shift_id in enumerate(sorted(planned)):
+        if i not in received:
+            missed += 1
+            continue
+        lateness.append((received[i] - planned[shift_id]).total_seconds())
+    return lateness, missed
+
+
+async def run(args):
+    from telebot import asyncio_helper
+    from bench.fake_api import FakeTelegramApi
+
+    api = FakeTelegramApi(latency=args.latency, flood_rate=args.flood_rate)
+    await api.start()
+    asyncio_helper.API_URL = api.api_url
+
+    import main
+
+    main.outbound.start()
+    scheduler_task = asyncio.create_task(main.scheduler.run())
+
+    latencies = []
+    try:
+        elapsed = await replay_sessions(main, args.admins, latencies)
+        lateness, missed = await replay_schedule(main, api, args.shifts, args.spread, args.grace)
+    finally:
+        scheduler_task.cancel()
+        await main.outbound.stop()
+        await main.bot.close_session()
+        await api.stop()
+
+    print(f"Handlers: {len(latencies)} updates in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:.1f} updates/s)")
+    print(f"  latency p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} ms, "
+          f"max {max(latencies, default=0) * 1000:.1f} ms")
+    print(f"Pings: {len(lateness)}/{args.shifts} delivered, {missed} missed")
+    if lateness:
+        print(f"  lateness p50 {percentile(lateness, 50) * 1000:.1f} ms, "
+              f"p99 {percentile(lateness, 99) * 1000:.1f} ms, "
+              f"mean {statistics.mean(lateness) * 1000:.1f} ms")
+    late = sum(1 for x in lateness if x > args.late_threshold)
+    print(f"  late (> {args.late_threshold}s): {late}")
+    return missed == 0 and late == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bot handlers and scheduler against a fake Bot API")
+    parser.add_argument("--admins", type=int, default=20, help="concurrent admin sessions")
+    parser.add_argument("--shifts", type=int, default=50, help="pings to schedule, one group each")
+    parser.add_argument("--spread", type=float, default=5.0, help="seconds over which pings are spread")
+    parser.add_argument("--grace", type=float, default=3.0, help="seconds to wait for late pings")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake API response delay, seconds")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="share of API calls answered with 429")
+    parser.add_argument("--late-threshold", type=float, default=1.0, help="ping counts as late after N seconds")
+    args = parser.parse_args()
+
+    # Отдельный файл графика и синтетические админы, чтобы не трогать рабочие данные
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    settings.DATA_FILE = os.path.join(workdir, "shifts.json")
+    settings.STORAGE_BACKEND = "json"
+    settings.STATE_BACKEND = "memory"
+    settings.WEBHOOK_URL = None
+    settings.DEAD_LETTER_FILE = os.path.join(workdir, "dead_letter.jsonl")
+    settings.ADMIN_IDS = [ADMIN_BASE + i for i in range(args.admins)]
+
+    ok = asyncio.run(run(args))
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import csv
+import io
+import json
+from fsm import VALIDATORS
+from intervals import to_minutes, weekday_segments
+from timeline import validate_recurrence, weekdays_of
+
+# Колонки CSV; в JSON — те же ключи плюс необязательное правило повторения
+CSV_FIELDS = ("start_time", "end_time", "username")
+# Больше такого файла график команды не бывает
+MAX_IMPORT_BYTES = 1024 * 1024
+
+
+# Ошибки разбора всего файла сразу: [(номер строки или записи, текст)]
+class ScheduleImportError(ValueError):
+    def __init__(self, errors):
+        super().__init__("; ".join(f"{where}: {text}" for where, text in errors))
+        self.errors = errors
+
+
+def _read_json(text):
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ScheduleImportError([(e.lineno, "invalid JSON")])
+    # Принимаем и список смен, и {"shifts": [...]}, как в файле хранилища
+    if isinstance(data, dict):
+        data = data.get("shifts")
+    if not isinstance(data, list):
+        raise ScheduleImportError([(1, "expected a list of shifts")])
+    return list(enumerate(data, 1))
+
+
+def _read_csv(text):
+    lines = text.splitlines()
+    # Заголовок необязателен: без него колонки идут в порядке CSV_FIELDS
+    has_header = bool(lines) and lines[0].replace(" ", "").lower().startswith("start_time")
+    reader = csv.DictReader(io.StringIO(text), fieldnames=None if has_header else CSV_FIELDS, skipinitialspace=True)
+    return [(reader.line_num, row) for row in reader if any(v for v in row.values() if isinstance(v, str))]
+
+
+def _validate(row):
+    if not isinstance(row, dict):
+        raise ValueError("expected an object")
+
+    start_time, end_time = (str(row.get(k) or "").strip() for k in ("start_time", "end_time"))
+    if not VALIDATORS["time"].fullmatch(f"{start_time}-{end_time}"):
+        raise ValueError(f"invalid time {start_time}-{end_time}")
+    to_minutes(start_time), to_minutes(end_time)
+
+    username = str(row.get("username") or "").strip()
+    match = VALIDATORS["username"].fullmatch(username if username.startswith("@") else f"@{username}")
+    if not match:
+        raise ValueError(f"invalid username {username!r}")
+
+    recurrence = validate_recurrence(row.get("recurrence"))
+
+    return {"username": match.group(1), "start_time": start_time, "end_time": end_time, "recurrence": recurrence}
+
+
+# Пересечения внутри загружаемого графика по каждому дню недели: отрезки по началу,
+# каждый должен начинаться после конца предыдущих
+def _overlaps(shifts):
+    days = [[] for _ in range(7)]
+    for where, shift in shifts:
+        for day, start, end in weekday_segments(shift["start_time"], shift["end_time"], weekdays_of(shift)):
+            days[day].append((start, end, where))
+
+    errors = {}
+    for pieces in days:
+        latest_end, latest_where = -1, None
+        for start, end, where in sorted(pieces):
+            if start < latest_end:
+                errors.setdefault((where, latest_where), (where, f"overlaps shift at {latest_where}"))
+            if end > latest_end:
+                latest_end, latest_where = end, where
+    return sorted(errors.values())
+
+
+# Текст CSV или JSON -> список смен; все ошибки собираются в одно ScheduleImportError
+def parse_schedule(text):
+    text = text.lstrip("\ufeff").strip()
+    if not text:
+        raise ScheduleImportError([(1, "empty schedule")])
+    rows = _read_json(text) if text[0] in "[{" else _read_csv(text)
+    # Пустой файл стёр бы весь график команды — так не бывает нарочно
+    if not rows:
+        raise ScheduleImportError([(1, "no shifts in schedule")])
+
+    shifts, errors = [], []
+    for where, row in rows:
+        try:
+            shifts.append((where, _validate(row)))
+        except ValueError as e:
+            errors.append((where, str(e)))
+    if not errors:
+        errors = _overlaps(shifts)
+    if errors:
+        raise ScheduleImportError(errors)
+    return [shift for _, shift in shifts]
+
+
+# График команды в CSV или JSON (JSON сохраняет и правила повторения)
+def export_schedule(shifts, fmt="json"):
+    if fmt == "csv":
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=CSV_FIELDS, extrasaction="ignore", lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(shifts)
+        return out.getvalue()
+
+    fields = CSV_FIELDS + ("recurrence",)
+    return json.dumps([{k: s.get(k) for k in fields} for s in shifts], ensure_ascii=False, indent=2)
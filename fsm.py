@@ -0,0 +1,57 @@
+import re
+import metrics
+
+# Валидаторы ввода, компилируются один раз
+VALIDATORS = {
+    "time": re.compile(r'(\d{2}:\d{2})-(\d{2}:\d{2})'),
+    "username": re.compile(r'@([a-zA-Z0-9_]+)'),
+    "schedule": re.compile(r'\S[\s\S]*'),  # вставленный CSV/JSON целиком
+}
+
+
+# Табличный роутер диалога: кнопка меню -> обработчик, этап -> (ожидаемый ввод, обработчик)
+class StateRouter:
+    def __init__(self):
+        self._commands = {}
+        self._routes = {}  # stage -> (pattern, handler, fallback)
+
+    # Кнопка/команда, работает на любом этапе: handler(message)
+    def command(self, *texts):
+        def decorator(handler):
+            for text in texts:
+                self._commands[text] = handler
+            return handler
+        return decorator
+
+    # Этап диалога: handler(message, state, match), fallback(message, state) — ввод не прошёл проверку
+    def route(self, stage, kind, fallback):
+        pattern = VALIDATORS[kind]
+
+        def decorator(handler):
+            self._routes[stage] = (pattern, handler, fallback)
+            return handler
+        return decorator
+
+    async def dispatch(self, message, state):
+        text = message.text.strip()
+
+        handler = self._commands.get(text)
+        if handler:
+            with metrics.timer("handler_seconds", handler=handler.__name__):
+                await handler(message)
+            return True
+
+        route = self._routes.get(state["stage"]) if state else None
+        if not route:
+            return False
+
+        pattern, handler, fallback = route
+        match = pattern.match(text)
+        if not match:
+            handler = fallback
+        with metrics.timer("handler_seconds", handler=handler.__name__):
+            if match:
+                await handler(message, state, match)
+            else:
+                await handler(message, state)
+        return True
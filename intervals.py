@@ -0,0 +1,113 @@
+import bisect
+from storage import shift_repo
+from tools import cached
+from timeline import DEFAULT_WEEKDAYS, shift_timezone, weekdays_of
+
+MINUTES_PER_DAY = 24 * 60
+
+
+# "HH:MM" -> минуты от полуночи; ValueError для несуществующего времени
+def to_minutes(value):
+    hours, minutes = map(int, value.split(":"))
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Invalid time: {value}")
+    return hours * 60 + minutes
+
+
+# Смена как отрезки внутри суток: ночная (22:00-02:00) делится на два,
+# одинаковые начало и конец — круглосуточная смена
+def segments(start_time, end_time):
+    start, end = to_minutes(start_time), to_minutes(end_time)
+    if start < end:
+        return [(start, end)]
+    if start == end:
+        return [(0, MINUTES_PER_DAY)]
+    return [(start, MINUTES_PER_DAY)] + ([(0, end)] if end else [])
+
+
+# Отрезки смены по дням недели: (день, начало, конец). Хвост ночной смены после полуночи
+# идёт уже следующим днём: пятничная 22:00-02:00 занимает субботу до 02:00
+def weekday_segments(start_time, end_time, weekdays=DEFAULT_WEEKDAYS):
+    return [((day + offset) % 7, start, end) for day in set(weekdays)
+            for offset, (start, end) in enumerate(segments(start_time, end_time))]
+
+
+# Длительность смены в минутах
+def duration(start_time, end_time):
+    return sum(end - start for start, end in segments(start_time, end_time))
+
+
+# Отрезки смен одного дня недели [(начало, конец, смена)]: в один день они не пересекаются
+class _DaySegments:
+    def __init__(self, pieces):
+        pieces = sorted(pieces, key=lambda piece: piece[:2])
+        self._starts = [start for start, _, _ in pieces]
+        self._pieces = pieces
+
+    def overlapping(self, start, end, exclude_id=None):
+        # Отрезки не пересекаются, поэтому у последнего начавшегося раньше end самый поздний конец
+        i = bisect.bisect_left(self._starts, end) - 1
+        while i >= 0:
+            seg_start, seg_end, shift = self._pieces[i]
+            if seg_end <= start:
+                break
+            if shift["id"] != exclude_id:
+                return shift
+            i -= 1
+        return None
+
+    def current(self, minute):
+        i = bisect.bisect_right(self._starts, minute) - 1
+        if i >= 0:
+            start, end, shift = self._pieces[i]
+            if minute < end:
+                return shift
+        return None
+
+
+# Смены команды по дням недели: пересечения и кандидаты в дежурные — за O(log n).
+# Смены в одно время, но в разные дни (пн-ср и чт-пт) друг другу не мешают
+class ShiftIntervalIndex:
+    def __init__(self, shifts):
+        self.shifts = sorted(shifts, key=lambda s: to_minutes(s["start_time"]))
+        days = [[] for _ in range(7)]
+        for shift in self.shifts:
+            for day, start, end in weekday_segments(shift["start_time"], shift["end_time"], weekdays_of(shift)):
+                days[day].append((start, end, shift))
+        self._days = [_DaySegments(pieces) for pieces in days]
+        self._timezones = {shift_timezone(s) for s in self.shifts}
+
+    # Смена, с которой пересекается интервал в те же дни недели (exclude_id — редактируемая смена)
+    def overlapping(self, start_time, end_time, exclude_id=None, weekdays=DEFAULT_WEEKDAYS):
+        for day, start, end in sorted(weekday_segments(start_time, end_time, weekdays)):
+            shift = self._days[day].overlapping(start, end, exclude_id)
+            if shift:
+                return shift
+        return None
+
+    # Смены, которые по часам своего часового пояса идут в moment (локальное время сервера).
+    # Не больше одной на часовой пояс; не отменена ли смена в этот день, проверяет таймлайн
+    def current(self, moment):
+        found = {}
+        for tz in self._timezones:
+            local = moment.astimezone(tz) if tz else moment
+            shift = self._days[local.weekday()].current(local.hour * 60 + local.minute)
+            if shift:
+                found[shift["id"]] = shift
+        return list(found.values())
+
+    # Предыдущий дежурный: последнее повторение другой смены команды, начавшееся до before
+    # (в понедельник утром это пятничная смена). (начало, username) или None
+    def previous(self, shift, before, timeline):
+        found = None
+        for candidate in self.shifts:
+            if candidate["id"] == shift["id"]:
+                continue
+            occurrence = timeline.last_before(candidate, before)
+            if occurrence and (found is None or occurrence[0] > found[0]):
+                found = occurrence
+        return found
+
+
+def shift_index(team):
+    return cached(("index", team), lambda: ShiftIntervalIndex(shift_repo.for_team(*team)))
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import metrics
+import os
+import socket
+import sqlite3
+import time
+from settings import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировки нет, каждый процесс считает себя лидером
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Срок аренды, сек; продлеваем втрое чаще, столько же ждёт смены лидера резервный экземпляр
+LEASE_TTL = 15
+
+
+def holder_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# Аренда на файловой блокировке (экземпляры на одной машине): держится, пока процесс жив,
+# при падении ОС снимает её сама
+class FileLease:
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        if self._file:
+            return True
+        f = open(self.path, "a+", encoding="utf-8")
+        try:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(holder_id())
+        f.flush()
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+# Аренда в отдельной SQLite-базе рядом с графиком: запись с владельцем и сроком, протухает без продления
+class SqliteLease:
+    def __init__(self, path, name="scheduler", ttl=LEASE_TTL):
+        self.name = name
+        self.ttl = ttl
+        self.holder = holder_id()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+    # Захват и продление одним запросом: аренда наша или чужая, но истёкшая
+    def acquire(self):
+        now = time.time()
+        cur = self._conn.execute(
+            "INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+            "WHERE leases.holder = excluded.holder OR leases.expires_at < ?",
+            (self.name, self.holder, now + self.ttl, now)
+        )
+        return cur.rowcount == 1
+
+    def release(self):
+        self._conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder))
+
+
+def create_lease():
+    if getattr(settings, "STORAGE_BACKEND", "json") == "sqlite":
+        # Отдельный файл: продление аренды в базе графика меняло бы data_version,
+        # и каждый экземпляр каждые LEASE_TTL/3 секунд перестраивал бы всё по графику
+        path = getattr(settings, "LEASE_DB_FILE", getattr(settings, "DB_FILE", "shifts.db") + ".leader")
+        return SqliteLease(path, ttl=getattr(settings, "LEASE_TTL", LEASE_TTL))
+    return FileLease(settings.DATA_FILE + ".leader")
+
+
+# Выборы лидера: пингует только экземпляр с арендой, остальные лишь обрабатывают апдейты.
+# work — корутина-функция (планировщик), запускается при получении аренды и отменяется при потере
+class LeaderElector:
+    def __init__(self, lease, work, ttl=LEASE_TTL):
+        self.lease = lease
+        self.work = work
+        self.ttl = ttl
+
+    def _check(self):
+        try:
+            return self.lease.acquire()
+        except Exception as e:
+            # Не смогли продлить — считаем аренду потерянной, пока не подтвердим снова
+            logger.error("Leader election: lease check failed: %s", e)
+            return False
+
+    async def run(self):
+        task = None
+        try:
+            while True:
+                leader = self._check()
+                if leader and task is None:
+                    logger.info("Leader election: %s is the leader", holder_id())
+                    metrics.inc("leader_elections_total")
+                    task = asyncio.create_task(self.work())
+                elif not leader and task is not None:
+                    logger.warning("Leader election: lease lost, stopping scheduler")
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    task = None
+                elif task is not None and task.done():
+                    logger.error("Leader election: scheduler stopped: %s", task.exception())
+                    task = None
+                    continue
+                await asyncio.sleep(self.ttl / 3)
+        finally:
+            if task is not None:
+                task.cancel()
+            self.lease.release()
@@ -1,15 +1,40 @@
+import atexit
+import json
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 import os
 
-def setup_logger():
+_listener = None
+
+
+# Одна JSON-строка на запись — удобно для сборщиков логов
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+def setup_logger(json_format=False):
+    global _listener
+
     log_dir = "logs"
     os.makedirs(log_dir, exist_ok=True)
 
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
 
-    formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
+    if json_format:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
 
     handler = TimedRotatingFileHandler(
         filename=os.path.join(log_dir, "bot.log"),
@@ -24,7 +49,14 @@ def setup_logger():
     # Удаляем старые обработчики (если есть)
     if logger.hasHandlers():
         logger.handlers.clear()
+    if _listener:
+        _listener.stop()
 
-    logger.addHandler(handler)
+    # Запись на диск и ротация — в отдельном потоке, обработчики бота только кладут запись в очередь
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
 
-    return logger
\ No newline at end of file
+    return logger
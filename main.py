@@ -1,53 +1,82 @@
-import re
-import threading
-import time
-import telebot
+import asyncio
+import metrics
+from datetime import datetime, timedelta
 from telebot import types
+from telebot.async_telebot import AsyncTeleBot
 from logger import setup_logger
-from datetime import datetime
 from settings import settings
-from tools import load_shifts, save_shifts, escape_markdown_v2
-
-logger = setup_logger()
-user_states = {}
-
-bot = telebot.TeleBot(settings.BOT_TOKEN)
-
-# Пинг смены в группу
-def ping_shift_start():
-    logger.info("Scheduler: checking shifts...")
-
-    if datetime.now().weekday() >= 5:
-        logger.info("Weekend. Ping off")
-        return
+from storage import shift_repo, default_team, team_of, create_fired_log
+from intervals import shift_index, to_minutes, duration
+from timeline import parse_recurrence, weekdays_of, DEFAULT_WEEKDAYS
+from bulk import parse_schedule, export_schedule, ScheduleImportError, MAX_IMPORT_BYTES
+from scheduler import ShiftScheduler, CATCHUP_GRACE
+from leader import LeaderElector, create_lease, LEASE_TTL
+from sender import OutboundQueue
+from webhook import WebhookServer
+from tools import escape_markdown_v2
+from fsm import StateRouter
+from state import create_state_store
+from render import MAIN_MENU, SCHEDULE_MENU, CANCEL_MENU, sorted_shifts, render_schedule, render_shift_keyboard
+
+logger = setup_logger(json_format=getattr(settings, "LOG_FORMAT", "text") == "json")
+# Незавершённые диалоги протухают через STATE_TTL секунд
+user_states = create_state_store("dialogs", ttl=getattr(settings, "STATE_TTL", 3600))
+admin_teams = create_state_store("teams")  # user_id -> (chat_id, thread_id), с графиком какой команды работает админ
+
+# Бот с замером времени и ошибок запросов к Telegram API
+class InstrumentedBot(AsyncTeleBot):
+    async def send_message(self, *args, **kwargs):
+        with metrics.timer("api_request_seconds", method="sendMessage"):
+            return await super().send_message(*args, **kwargs)
+
+    async def edit_message_text(self, *args, **kwargs):
+        with metrics.timer("api_request_seconds", method="editMessageText"):
+            return await super().edit_message_text(*args, **kwargs)
+
+    async def edit_message_reply_markup(self, *args, **kwargs):
+        with metrics.timer("api_request_seconds", method="editMessageReplyMarkup"):
+            return await super().edit_message_reply_markup(*args, **kwargs)
+
+    async def send_document(self, *args, **kwargs):
+        with metrics.timer("api_request_seconds", method="sendDocument"):
+            return await super().send_document(*args, **kwargs)
+
+    async def answer_callback_query(self, *args, **kwargs):
+        with metrics.timer("api_request_seconds", method="answerCallbackQuery"):
+            return await super().answer_callback_query(*args, **kwargs)
+
+
+bot = InstrumentedBot(settings.BOT_TOKEN)
+outbound = OutboundQueue(bot)
+router = StateRouter()
+
+
+def current_team(user_id):
+    return tuple(admin_teams.get(user_id) or default_team())
+
+
+# Команда смены из диалога: у редактируемой — своя, у новой — выбранная админом
+def state_team(user_id, state):
+    if "shift_id" in state:
+        shift = shift_repo.get(state["shift_id"])
+        if shift:
+            return team_of(shift)
+    return current_team(user_id)
 
-    now = datetime.now().strftime("%H:%M")
-    shifts = load_shifts()
 
-    # Ищем смену, которая начинается сейчас
-    current_shift = None
-    for shift in shifts:
-        if shift["start_time"] == now:
-            current_shift = shift
-            break
+# Пинг смены в группу (вызывается планировщиком в момент начала смены)
+async def ping_shift_start(current_shift):
+    logger.info("Scheduler: shift %s starts", current_shift['id'])
 
-    if not current_shift:
-        logger.debug(f"No shift starts at {now}")
-        return
+    chat_id, thread_id = team_of(current_shift)
 
-    # Текущий менеджер
+    # Текущий менеджер (с учётом ротации — планировщик уже подставил дежурного этого дня)
     current_username = current_shift["username"]
     interval = f"{current_shift['start_time']}-{current_shift['end_time']}"
 
-    # Находим предыдущего менеджера
-    shifts_sorted = sorted(shifts, key=lambda x: x['start_time'])
-    current_index = next((i for i, s in enumerate(shifts_sorted) if s['start_time'] == now), -1)
-
-    prev_username = None
-    if current_index > 0:
-        prev_username = shifts_sorted[current_index - 1]["username"]
-    elif len(shifts_sorted) > 1:
-        prev_username = shifts_sorted[-1]["username"]  # Последняя смена предыдущего дня
+    # Находим предыдущего менеджера (для первой смены — последняя смена предыдущего рабочего дня)
+    prev_occurrence = shift_index((chat_id, thread_id)).previous(current_shift, datetime.now(), scheduler.timeline)
+    prev_username = prev_occurrence[1] if prev_occurrence else None
 
     # Формируем сообщение
     message = f"""**Смена ответственного\\!**
@@ -57,183 +86,166 @@ def ping_shift_start():
     if prev_username and prev_username != current_username:
         message += f"\n@{escape_markdown_v2(prev_username)} необходимо актуализировать информацию по незакрытым прелидам\\!"
 
-    try:
-        bot.send_message(
-            settings.GROUP_CHAT_ID,
-            message,
-            parse_mode='MarkdownV2',
-            disable_web_page_preview=True,
-            message_thread_id=settings.THREAD_ID  # если используете ветку
-        )
-        logger.info(f"Ping: @{current_username} ({interval}) [prev: {prev_username or 'none'}]")
-    except Exception as e:
-        logger.error(f"Ping error: {e}")
+    # Очередь сама соблюдает лимиты и повторяет отправку при ошибках
+    result = await outbound.send_message(
+        chat_id,
+        message,
+        parse_mode='MarkdownV2',
+        disable_web_page_preview=True,
+        message_thread_id=thread_id  # если используете ветку
+    )
+    metrics.inc("pings_total", result="sent" if result else "dead_letter")
+    if result:
+        logger.info("Ping %s/%s: @%s (%s) [prev: %s]", chat_id, thread_id, current_username, interval, prev_username or 'none')
+    else:
+        logger.error("Ping error: @%s (%s) moved to dead letters", current_username, interval)
 
 
 # Главное меню для админа
 @bot.message_handler(commands=['start'], func=lambda m: m.from_user.id in settings.ADMIN_IDS)
-def admin_start(message):
-    logger.info(f"Admin {message.from_user.id} opened main menu")
-    markup = telebot.types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add("Добавить смену")
-    markup.add("График")
-    markup.add("Редактировать")
-    markup.add("Удалить")
+@metrics.timed("handler_seconds", handler="admin_start")
+async def admin_start(message):
+    logger.info("Admin %s opened main menu", message.from_user.id)
+    await bot.send_message(message.chat.id,
+                           "**Добро пожаловать в напоминателя\\!**\n"
+                           "Вам открыт доступ к админ\\-панели",
+                           parse_mode='MarkdownV2', reply_markup=MAIN_MENU)
+
+
+# Выбор команды (чат и ветка), с графиком которой работает админ.
+# В группе: /team — текущий чат и ветка; в личке: /team <chat_id> [thread_id]
+@bot.message_handler(commands=['team'], func=lambda m: m.from_user.id in settings.ADMIN_IDS)
+@metrics.timed("handler_seconds", handler="select_team")
+async def select_team(message):
+    args = message.text.split()[1:]
+    try:
+        if args:
+            chat_id = int(args[0])
+            thread_id = int(args[1]) if len(args) > 1 else None
+        elif message.chat.type != "private":
+            chat_id = message.chat.id
+            thread_id = message.message_thread_id if message.is_topic_message else None
+        else:
+            chat_id, thread_id = current_team(message.from_user.id)
+            await bot.send_message(message.chat.id,
+                                   f"**Текущая команда:** `{chat_id}` / `{thread_id or '-'}`\n\n"
+                                   "Выбрать: `/team <chat_id> [thread_id]` или `/team` в нужном чате",
+                                   parse_mode='MarkdownV2')
+            return
+    except ValueError:
+        await bot.send_message(message.chat.id,
+                               "**Неверный формат\\!**\n"
+                               "Пример: `/team -1001234567890 42`", parse_mode='MarkdownV2')
+        return
 
-    bot.send_message(message.chat.id,
-                     "**Добро пожаловать в напоминателя\\!**\n"
-                     "Вам открыт доступ к админ\\-панели",
-                     parse_mode='MarkdownV2', reply_markup=markup)
+    admin_teams[message.from_user.id] = (chat_id, thread_id)
+    logger.info("Admin %s selected team %s/%s", message.from_user.id, chat_id, thread_id)
+    await bot.send_message(message.chat.id,
+                           f"**Команда выбрана:** `{chat_id}` / `{thread_id or '-'}`",
+                           parse_mode='MarkdownV2')
 
 
 # Добавить смену
-@bot.message_handler(func=lambda m: m.from_user.id in settings.ADMIN_IDS and m.text == "Добавить смену")
-def add_shift_start(message):
-    logger.info(f"Admin {message.from_user.id} started adding shift")
+@router.command("Добавить смену")
+async def add_shift_start(message):
+    logger.info("Admin %s started adding shift", message.from_user.id)
     user_states[message.from_user.id] = {"stage": "waiting_time"}
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    markup.add("Отмена")
 
-    bot.send_message(message.chat.id,
-                     "**Добавление смены**\n\n"
-                     "**Шаг 1/2:** Введите время смены:\n"
-                     "Например: `17:00-19:00`",
-                     parse_mode='MarkdownV2', reply_markup=markup)
+    await bot.send_message(message.chat.id,
+                           "**Добавление смены**\n\n"
+                           "**Шаг 1/2:** Введите время смены:\n"
+                           "Например: `17:00-19:00`",
+                           parse_mode='MarkdownV2', reply_markup=CANCEL_MENU)
 
 
 # График - последовательно по времени
-@bot.message_handler(func=lambda m: m.from_user.id in settings.ADMIN_IDS and m.text == "График")
-def show_schedule(message):
-    logger.info(f"Admin {message.from_user.id} requested schedule")
-    shifts = load_shifts()
-    logger.info(f"Found {len(shifts)} shifts in schedule")
-
-    if not shifts:
-        text = "**График пуст**\n\nНажмите «Добавить смену»"
-    else:
-        shifts_sorted = sorted(shifts, key=lambda x: x['start_time'])
-
-        text = "**График дежурств:**```\n"
-        text += f"{'Время':<12} {'Менеджер':<15}\n"
-        text += f"{'-' * 12} {'-' * 15}\n"
-
-        for shift in shifts_sorted:
-            time_range = f"{shift['start_time']}-{shift['end_time']}"
-            text += f"{time_range:<12} @{escape_markdown_v2(shift['username']):<15}\n"
-        text += "```"
+@router.command("График")
+async def show_schedule(message):
+    logger.info("Admin %s requested schedule", message.from_user.id)
+    team = current_team(message.from_user.id)
+    logger.info("Found %s shifts in schedule", len(sorted_shifts(team)))
 
-        logger.info(f"Schedule sorted by time: {len(shifts_sorted)} shifts")
-
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add("Добавить смену", "Редактировать")
-    markup.add("График", "Удалить")
-
-    bot.send_message(message.chat.id, text, parse_mode='MarkdownV2', reply_markup=markup)
+    text = render_schedule(team)
+    await bot.send_message(message.chat.id, text, parse_mode='MarkdownV2', reply_markup=SCHEDULE_MENU)
 
 
 # Редактировать график
-@bot.message_handler(func=lambda m: m.from_user.id in settings.ADMIN_IDS and m.text == "Редактировать")
-def edit_shift_menu(message):
-    logger.info(f"Admin {message.from_user.id} opened edit menu")
-    shifts = load_shifts()
+@router.command("Редактировать")
+async def edit_shift_menu(message):
+    logger.info("Admin %s opened edit menu", message.from_user.id)
+    markup = render_shift_keyboard(current_team(message.from_user.id), "edit")
 
-    if not shifts:
+    if not markup:
         logger.info("Edit menu: no shifts found")
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-        markup.add("Добавить смену")
-        markup.add("График")
-        markup.add("Редактировать")
-        markup.add("Удалить")
-        bot.send_message(message.chat.id, "**График пуст!**\nДобавьте смены.",
-                         parse_mode='MarkdownV2', reply_markup=markup)
+        await bot.send_message(message.chat.id, "**График пуст!**\nДобавьте смены.",
+                               parse_mode='MarkdownV2', reply_markup=MAIN_MENU)
         return
 
-    shifts_sorted = sorted(shifts, key=lambda x: x['start_time'])
-
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    for shift in shifts_sorted:
-        shift_text = f"{shift['start_time']}-{shift['end_time']} @{escape_markdown_v2(shift['username'])}"
-        markup.add(
-            types.InlineKeyboardButton(
-                f"{shift_text}",
-                callback_data=f"edit_{shift['id']}"
-            )
-        )
-    markup.add(types.InlineKeyboardButton("Назад", callback_data="back_admin"))
-
     text = "**Выберите смену для редактирования:**"
-    bot.send_message(message.chat.id, text, parse_mode='MarkdownV2', reply_markup=markup)
-    logger.info(f"Edit menu sent with {len(shifts)} shifts")
+    await bot.send_message(message.chat.id, text, parse_mode='MarkdownV2', reply_markup=markup)
+    logger.info("Edit menu sent with %s shifts", len(sorted_shifts(current_team(message.from_user.id))))
 
 
 # Удалить смену
-@bot.message_handler(func=lambda m: m.from_user.id in settings.ADMIN_IDS and m.text == "Удалить")
-def delete_shift_menu(message):
-    logger.info(f"Admin {message.from_user.id} opened delete menu")
-    shifts = load_shifts()
-    if not shifts:
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-        markup.add("Добавить смену")
-        markup.add("График")
-        markup.add("Редактировать")
-        markup.add("Удалить")
-        bot.send_message(message.chat.id, "**График пуст!**\nДобавьте смены.",
-                         parse_mode='MarkdownV2', reply_markup=markup)
+@router.command("Удалить")
+async def delete_shift_menu(message):
+    logger.info("Admin %s opened delete menu", message.from_user.id)
+    markup = render_shift_keyboard(current_team(message.from_user.id), "del")
+    if not markup:
+        await bot.send_message(message.chat.id, "**График пуст!**\nДобавьте смены.",
+                               parse_mode='MarkdownV2', reply_markup=MAIN_MENU)
         return
 
-    shifts_sorted = sorted(shifts, key=lambda x: x['start_time'])
-
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    for shift in shifts_sorted:
-        shift_text = f"{shift['start_time']}-{shift['end_time']} @{escape_markdown_v2(shift['username'])}"
-        markup.add(
-            types.InlineKeyboardButton(
-                f"{shift_text}",
-                callback_data=f"del_{shift['id']}"
-            )
-        )
-    markup.add(types.InlineKeyboardButton("Назад", callback_data="back_admin"))
-
     text = "**Выберите смену для удаления:**"
-    bot.send_message(message.chat.id, text, parse_mode='MarkdownV2', reply_markup=markup)
-    logger.info(f"Delete menu sent with {len(shifts)} shifts")
+    await bot.send_message(message.chat.id, text, parse_mode='MarkdownV2', reply_markup=markup)
+    logger.info("Delete menu sent with %s shifts", len(sorted_shifts(current_team(message.from_user.id))))
 
 
 # Обработчик INLINE кнопок
 @bot.callback_query_handler(func=lambda call: call.from_user.id in settings.ADMIN_IDS)
-def inline_callback_handler(call):
+@metrics.timed("handler_seconds", handler="inline_callback")
+async def inline_callback_handler(call):
     data = call.data
-    logger.info(f"Inline callback: {data} from user {call.from_user.id}")
+    logger.info("Inline callback: %s from user %s", data, call.from_user.id)
 
     # Назад в главное меню
     if data == "back_admin":
         logger.info("Back to admin menu")
-        bot.edit_message_text("**Главное меню**",
-                              call.message.chat.id, call.message.message_id,
-                              parse_mode='MarkdownV2')
-        admin_start(call.message)
-        bot.answer_callback_query(call.id)
+        await bot.edit_message_text("**Главное меню**",
+                                    call.message.chat.id, call.message.message_id,
+                                    parse_mode='MarkdownV2')
+        await admin_start(call.message)
+        await bot.answer_callback_query(call.id)
+        return
+
+    # Листание меню смен: page_<edit|del>_<номер страницы>
+    if data.startswith("page_"):
+        _, action, page = data.split("_")
+        markup = render_shift_keyboard(current_team(call.from_user.id), action, int(page))
+        if markup:
+            await bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id,
+                                                reply_markup=markup)
+        await bot.answer_callback_query(call.id)
         return
 
     # Редактирование смены
     if data.startswith("edit_"):
         shift_id = int(data.split("_")[1])
-        logger.info(f"Edit shift request: ID {shift_id}")
+        logger.info("Edit shift request: ID %s", shift_id)
 
-        shifts = load_shifts()
-        shift = next((s for s in shifts if s["id"] == shift_id), None)
+        shift = shift_repo.get(shift_id)
 
         if shift:
             user_states[call.from_user.id] = {
-                "stage": "waiting_time_edit",
+                "stage": "waiting_time",
                 "shift_id": shift_id
             }
-            logger.info(f"Edit state set for shift ID {shift_id}")
+            logger.info("Edit state set for shift ID %s", shift_id)
 
             markup = types.InlineKeyboardMarkup()
             markup.add(types.InlineKeyboardButton("Отмена", callback_data="back_admin"))
 
-            bot.edit_message_text(
+            await bot.edit_message_text(
                 f"**Редактирование смены ID `{shift_id}`**\n\n"
                 f"Текущее: `{shift['start_time']}-{shift['end_time']} @{escape_markdown_v2(shift['username'])}`\n\n"
                 f"**Шаг 1/2:** Введите новое время:\n"
@@ -242,228 +254,363 @@ def inline_callback_handler(call):
                 parse_mode='MarkdownV2', reply_markup=markup
             )
         else:
-            logger.info(f"Shift ID {shift_id} not found")
-        bot.answer_callback_query(call.id)
+            logger.info("Shift ID %s not found", shift_id)
+        await bot.answer_callback_query(call.id)
         return
 
     # Удаление смены
     if data.startswith("del_"):
         shift_id = int(data.split("_")[1])
-        logger.info(f"Delete shift request: ID {shift_id}")
+        logger.info("Delete shift request: ID %s", shift_id)
 
-        shifts = load_shifts()
-        shift = next((s for s in shifts if s["id"] == shift_id), None)
+        shift = shift_repo.delete(shift_id)
 
         if shift:
-            shifts = [s for s in shifts if s["id"] != shift_id]
-            save_shifts(shifts)
-            logger.info(f"Shift ID {shift_id} deleted: {shift['start_time']}-{shift['end_time']} @{escape_markdown_v2(shift['username'])}")
+            logger.info("Shift ID %s deleted: %s-%s @%s", shift_id, shift['start_time'], shift['end_time'], shift['username'])
 
-            bot.edit_message_text(
+            await bot.edit_message_text(
                 f"**Смена удалена\\!**\n\n"
                 f"`{shift['start_time']}-{shift['end_time']}`: **@{escape_markdown_v2(shift['username'])}**\n\n"
                 f"ID: `{shift_id}`",
                 call.message.chat.id, call.message.message_id,
                 parse_mode='MarkdownV2'
             )
-            bot.answer_callback_query(call.id, "Смена удалена\\!")
+            await bot.answer_callback_query(call.id, "Смена удалена\\!")
         else:
-            logger.info(f"Shift ID {shift_id} not found for deletion")
-            bot.answer_callback_query(call.id, "Смена не найдена\\!")
+            logger.info("Shift ID %s not found for deletion", shift_id)
+            await bot.answer_callback_query(call.id, "Смена не найдена\\!")
         return
 
-    bot.answer_callback_query(call.id)
+    await bot.answer_callback_query(call.id)
 
 
-@bot.message_handler(func=lambda m: m.from_user.id in settings.ADMIN_IDS)
-def handle_admin_input(message):
-    user_id = message.from_user.id
-    text = message.text.strip()
-    logger.info(f"Admin input from {user_id}: '{text}' | State: {user_states.get(user_id, 'none')}")
-
-    # Главное меню
-    if text == "Главное меню":
-        logger.info(f"Admin {user_id} returned to main menu")
-        admin_start(message)
-        if user_id in user_states:
-            del user_states[user_id]
+# Кто дежурит сейчас. В группе — по её графику, в личке у админа — по выбранной команде
+@bot.message_handler(commands=['now'])
+async def who_is_on_duty(message):
+    if message.chat.type == "private":
+        if message.from_user.id not in settings.ADMIN_IDS:
+            return
+        team = current_team(message.from_user.id)
+    else:
+        team = (message.chat.id, message.message_thread_id if message.is_topic_message else None)
+
+    # Кандидаты по времени суток — из индекса за O(log n); дежурит тот, чьё последнее повторение
+    # ещё не закончилось (дни недели, пропуски, ротацию и часовой пояс учитывает таймлайн)
+    now = datetime.now()
+    index = shift_index(team)
+    shift, username = None, None
+    for candidate in index.current(now):
+        occurrence = scheduler.timeline.last_before(candidate, now)
+        if occurrence and now < occurrence[0] + timedelta(minutes=duration(candidate["start_time"],
+                                                                           candidate["end_time"])):
+            shift, (occurrence_start, username) = candidate, occurrence
+            break
+    logger.info("Duty query for team %s/%s: %s", team[0], team[1], shift['id'] if shift else 'none')
+
+    if not shift:
+        await bot.send_message(message.chat.id, "**Сейчас никто не дежурит**", parse_mode='MarkdownV2')
         return
 
-    # Отмена
-    if text == "Отмена":
-        logger.info(f"Admin {user_id} cancelled operation")
-        if user_id in user_states:
-            del user_states[user_id]
-        admin_start(message)
+    text = (f"**Сейчас дежурит:** @{escape_markdown_v2(username)} "
+            f"`{shift['start_time']}-{shift['end_time']}`")
+    prev_occurrence = index.previous(shift, occurrence_start, scheduler.timeline)
+    if prev_occurrence and prev_occurrence[1] != username:
+        text += f"\n**До этого:** @{escape_markdown_v2(prev_occurrence[1])}"
+    await bot.send_message(message.chat.id, text, parse_mode='MarkdownV2',
+                           message_thread_id=team[1] if message.chat.type != "private" else None)
+
+
+# Сводка метрик: длительность обработчиков, хранилища, запросов к API, отставание планировщика
+@bot.message_handler(commands=['metrics'], func=lambda m: m.from_user.id in settings.ADMIN_IDS)
+async def show_metrics(message):
+    logger.info("Admin %s requested metrics", message.from_user.id)
+    await bot.send_message(message.chat.id, metrics.render_summary()[:4096])
+
+
+# Повторение смены: /recur <id> [days=0-4] [rotate=@a,@b] [skip=2026-01-01,...] [tz=Europe/Moscow].
+# Без параметров — сброс к будням без ротации
+@bot.message_handler(commands=['recur'], func=lambda m: m.from_user.id in settings.ADMIN_IDS)
+@metrics.timed("handler_seconds", handler="set_recurrence")
+async def set_recurrence(message):
+    args = message.text.split()[1:]
+    try:
+        shift_id = int(args[0])
+        rule = parse_recurrence(args[1:], datetime.now().date())
+    except (IndexError, ValueError) as e:
+        logger.warning("Invalid recurrence %r: %s", message.text, e)
+        await bot.send_message(message.chat.id,
+                               "**Неверный формат\\!**\n"
+                               "Пример: `/recur 3 days=0-4 rotate=@anna,@oleg skip=2026-01-01 tz=Europe/Moscow`",
+                               parse_mode='MarkdownV2')
         return
 
-    # РЕДАКТИРОВАНИЕ: Ждём время для смены
-    if user_id in user_states and user_states[user_id]["stage"] == "waiting_time_edit":
-        logger.info(f"Edit time input: {text}")
-        time_match = re.match(r'(\d{2}:\d{2})-(\d{2}:\d{2})', text)
-
-        if time_match:
-            start_time = time_match.group(1)
-            end_time = time_match.group(2)
-            logger.info(f"Time validated: {start_time}-{end_time}")
-
-            user_states[user_id] = {
-                "stage": "waiting_username_edit",
-                "shift_id": user_states[user_id]["shift_id"],
-                "start_time": start_time,
-                "end_time": end_time
-            }
+    shift = shift_repo.get(shift_id)
+    if not shift:
+        await bot.send_message(message.chat.id, "**Смена не найдена\\!**", parse_mode='MarkdownV2')
+        return
 
-            markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-            markup.add("Отмена")
+    # Новые дни недели не должны накрывать смены команды в то же время
+    overlap = shift_index(team_of(shift)).overlapping(shift["start_time"], shift["end_time"], exclude_id=shift_id,
+                                                      weekdays=weekdays_of({"recurrence": rule}))
+    if overlap:
+        logger.info("Recurrence of shift %s overlaps shift %s", shift_id, overlap['id'])
+        await bot.send_message(message.chat.id,
+                               f"**В эти дни время пересекается со сменой** "
+                               f"`{overlap['start_time']}-{overlap['end_time']}` @{escape_markdown_v2(overlap['username'])}",
+                               parse_mode='MarkdownV2')
+        return
 
-            bot.send_message(message.chat.id,
-                             f"**Новое время:** `{start_time}-{end_time}`\n\n"
-                             "**Шаг 2/2:** Новый тег менеджера:\n"
-                             "Например: `@username`",
-                             parse_mode='MarkdownV2', reply_markup=markup)
-            return
-        else:
-            logger.info(f"Invalid time format: {text}")
-            bot.send_message(message.chat.id,
-                             "**Неверный формат времени\\!**\n"
-                             "Пример: `17:00-19:00`", parse_mode='MarkdownV2')
-            return
+    shift = shift_repo.update(shift_id, recurrence=rule)
+
+    logger.info("Admin %s set recurrence of shift %s: %s", message.from_user.id, shift_id, rule)
+    upcoming = scheduler.timeline.next_after(shift, datetime.now())
+    text = f"**Повторение смены `{shift_id}` обновлено\\!**"
+    if upcoming:
+        text += (f"\n\nБлижайшая: `{upcoming[0]:%Y-%m-%d %H:%M}` "
+                 f"@{escape_markdown_v2(upcoming[1])}")
+    await bot.send_message(message.chat.id, text, parse_mode='MarkdownV2')
+
+
+# Загрузка графика команды целиком: CSV (start_time,end_time,username) или JSON из /export,
+# следующим сообщением или файлом. Заменяет смены выбранной команды одной записью
+@bot.message_handler(commands=['import'], func=lambda m: m.from_user.id in settings.ADMIN_IDS)
+@metrics.timed("handler_seconds", handler="import_start")
+async def import_start(message):
+    logger.info("Admin %s started schedule import", message.from_user.id)
+    user_states[message.from_user.id] = {"stage": "waiting_import"}
+    await bot.send_message(message.chat.id,
+                           "**Загрузка графика**\n\n"
+                           "Пришлите файл или текст в CSV:\n"
+                           "```\nstart_time,end_time,username\n09:00,13:00,@anna\n13:00,18:00,@oleg\n```\n"
+                           "или JSON из /export\\. Текущий график команды будет заменён",
+                           parse_mode='MarkdownV2', reply_markup=CANCEL_MENU)
+
+
+# Выгрузка графика выбранной команды: /export или /export csv
+@bot.message_handler(commands=['export'], func=lambda m: m.from_user.id in settings.ADMIN_IDS)
+@metrics.timed("handler_seconds", handler="export_schedule")
+async def export_shifts(message):
+    fmt = "csv" if message.text.split()[1:2] == ["csv"] else "json"
+    shifts = sorted_shifts(current_team(message.from_user.id))
+    logger.info("Admin %s exported %s shifts as %s", message.from_user.id, len(shifts), fmt)
+    await bot.send_document(message.chat.id, export_schedule(shifts, fmt).encode("utf-8"),
+                            visible_file_name=f"schedule.{fmt}")
+
+
+async def apply_import(message, state, text):
+    team = current_team(message.from_user.id)
+    try:
+        shifts = parse_schedule(text)
+    except ScheduleImportError as e:
+        logger.warning("Schedule import rejected: %s", e)
+        lines = "\n".join(f"{where}: {error}" for where, error in e.errors[:20])
+        await bot.send_message(message.chat.id,
+                               "**График не загружен, ошибки:**\n"
+                               f"```\n{escape_markdown_v2(lines)}\n```\n"
+                               "Исправьте и пришлите снова:",
+                               parse_mode='MarkdownV2', reply_markup=CANCEL_MENU)
+        return
 
-    # РЕДАКТИРОВАНИЕ: Ждём username для смены
-    elif user_id in user_states and user_states[user_id]["stage"] == "waiting_username_edit":
-        logger.info(f"Edit username input: {text}")
-        username_match = re.match(r'@([a-zA-Z0-9_]+)', text)
-
-        if username_match:
-            username = username_match.group(1)
-            shift_data = user_states[user_id]
-            shift_id = shift_data["shift_id"]
-            logger.info(f"Username validated: @{username} for shift {shift_id}")
-
-            # Обновляем смену
-            shifts = load_shifts()
-            for shift in shifts:
-                if shift["id"] == shift_id:
-                    shift["start_time"] = shift_data["start_time"]
-                    shift["end_time"] = shift_data["end_time"]
-                    shift["username"] = username
-                    break
-
-            save_shifts(shifts)
-            logger.info(f"Shift {shift_id} updated: {shift_data['start_time']}-{shift_data['end_time']} @{username}")
-
-            # Очищаем состояние
-            del user_states[user_id]
-
-            markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-            markup.add("Добавить смену")
-            markup.add("График")
-            markup.add("Редактировать")
-            markup.add("Удалить")
-
-            bot.send_message(message.chat.id,
-                             f"**Смена {shift_id} обновлена\\!**\n\n"
-                             f"`{shift_data['start_time']}-{shift_data['end_time']}`: **@{escape_markdown_v2(username)}**",
-                             parse_mode='MarkdownV2', reply_markup=markup)
-            return
-        else:
-            logger.warning(f"Invalid username format: {text}")
-            bot.send_message(message.chat.id,
-                             "**Неверный формат\\!**\n"
-                             "Пример: `@username`", parse_mode='MarkdownV2')
-            return
+    shift_repo.replace_team(*team, shifts)
+    user_states.pop(message.from_user.id, None)
+    logger.info("Admin %s imported %s shifts for team %s/%s", message.from_user.id, len(shifts), *team)
+    await bot.send_message(message.chat.id,
+                           f"**График загружен\\!** Смен: {len(shifts)}",
+                           parse_mode='MarkdownV2', reply_markup=MAIN_MENU)
 
-    # Этап 1: Ждём время смены (17:00-19:00)
-    if user_id in user_states and user_states[user_id]["stage"] == "waiting_time":
-        logger.info(f"Add time input: {text}")
-        time_match = re.match(r'(\d{2}:\d{2})-(\d{2}:\d{2})', text)
 
-        if time_match:
-            start_time = time_match.group(1)
-            end_time = time_match.group(2)
-            logger.info(f"Add time validated: {start_time}-{end_time}")
+async def invalid_schedule(message, state):
+    await bot.send_message(message.chat.id, "**Пришлите график файлом или текстом**",
+                           parse_mode='MarkdownV2', reply_markup=CANCEL_MENU)
 
-            user_states[user_id] = {
-                "stage": "waiting_username",
-                "start_time": start_time,
-                "end_time": end_time
-            }
 
-            markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-            markup.add("Отмена")
+@router.route("waiting_import", "schedule", fallback=invalid_schedule)
+async def schedule_text_entered(message, state, match):
+    await apply_import(message, state, message.text)
 
-            bot.send_message(message.chat.id,
-                             f"**Время:** `{start_time}-{end_time}`\n\n"
-                             "**Шаг 2/2:** Тег менеджера:\n"
-                             "Например: `@username`",
-                             parse_mode='MarkdownV2', reply_markup=markup)
-            return
-        else:
-            logger.warning(f"Invalid add time format: {text}")
-            bot.send_message(message.chat.id,
-                             "**Неверный формат времени\\!**\n"
-                             "Пример: `17:00-19:00`", parse_mode='MarkdownV2')
-            return
 
-    # Этап 2: Ждём username (@username)
-    elif user_id in user_states and user_states[user_id]["stage"] == "waiting_username":
-        logger.info(f"Add username input: {text}")
-        username_match = re.match(r'@([a-zA-Z0-9_]+)', text)
-
-        if username_match:
-            username = username_match.group(1)
-            shift_data = user_states[user_id]
-            logger.info(f"Add username validated: @{username}")
-
-            # Сохраняем смену
-            shifts = load_shifts()
-            new_id = max([s.get("id", 0) for s in shifts], default=0) + 1
-
-            new_shift = {
-                "id": new_id,
-                "username": username,
-                "start_time": shift_data["start_time"],
-                "end_time": shift_data["end_time"]
-            }
-            shifts.append(new_shift)
-            save_shifts(shifts)
-            logger.info(f"New shift added: ID {new_id}, {shift_data['start_time']}-{shift_data['end_time']} @{escape_markdown_v2(username)}")
-
-            # Очищаем состояние
-            del user_states[user_id]
-
-            markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-            markup.add("Добавить смену")
-            markup.add("График")
-            markup.add("Редактировать")
-            markup.add("Удалить")
-
-            bot.send_message(message.chat.id,
-                             f"**Смена добавлена\\!**\n\n"
-                             f"`{shift_data['start_time']}-{shift_data['end_time']}`: **@{escape_markdown_v2(username)}**",
-                             parse_mode='MarkdownV2', reply_markup=markup)
-            return
-        else:
-            logger.warning(f"Invalid add username format: {text}")
-            bot.send_message(message.chat.id,
-                             "**Неверный формат\\!**\n"
-                             "Пример: `@username`", parse_mode='MarkdownV2')
-            return
+# График файлом (только на этапе загрузки)
+@bot.message_handler(content_types=['document'], func=lambda m: m.from_user.id in settings.ADMIN_IDS)
+@metrics.timed("handler_seconds", handler="schedule_file")
+async def schedule_file_entered(message):
+    state = user_states.get(message.from_user.id)
+    if not state or state["stage"] != "waiting_import":
+        return
+    if (message.document.file_size or 0) > MAX_IMPORT_BYTES:
+        await bot.send_message(message.chat.id, "**Файл слишком большой**", parse_mode='MarkdownV2')
+        return
 
+    file_info = await bot.get_file(message.document.file_id)
+    data = await bot.download_file(file_info.file_path)
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        await bot.send_message(message.chat.id, "**Файл должен быть в UTF\\-8**", parse_mode='MarkdownV2')
+        return
+    await apply_import(message, state, text)
+
+
+# Главное меню / отмена текущего действия
+@router.command("Главное меню", "Отмена")
+async def cancel_operation(message):
+    logger.info("Admin %s cancelled operation", message.from_user.id)
+    user_states.pop(message.from_user.id, None)
+    await admin_start(message)
+
+
+async def invalid_time(message, state):
+    logger.warning("Invalid time format: %s", message.text)
+    await bot.send_message(message.chat.id,
+                           "**Неверный формат времени\\!**\n"
+                           "Пример: `17:00-19:00`", parse_mode='MarkdownV2')
+
+
+async def invalid_username(message, state):
+    logger.warning("Invalid username format: %s", message.text)
+    await bot.send_message(message.chat.id,
+                           "**Неверный формат\\!**\n"
+                           "Пример: `@username`", parse_mode='MarkdownV2')
+
+
+# Смены одной команды не должны пересекаться в общие дни недели; True — время занято, админу уже ответили
+async def reject_overlap(message, state, start_time, end_time):
+    team = state_team(message.from_user.id, state)
+    editing = shift_repo.get(state["shift_id"]) if "shift_id" in state else None
+    weekdays = weekdays_of(editing) if editing else DEFAULT_WEEKDAYS
+    overlap = shift_index(team).overlapping(start_time, end_time, exclude_id=state.get("shift_id"), weekdays=weekdays)
+    if not overlap:
+        return False
+
+    logger.info("Shift %s-%s overlaps shift %s", start_time, end_time, overlap['id'])
+    user_states[message.from_user.id] = {**state, "stage": "waiting_time"}
+    await bot.send_message(message.chat.id,
+                           f"**Время пересекается со сменой** "
+                           f"`{overlap['start_time']}-{overlap['end_time']}` @{escape_markdown_v2(overlap['username'])}\n\n"
+                           "Введите другое время:",
+                           parse_mode='MarkdownV2', reply_markup=CANCEL_MENU)
+    return True
+
+
+# Шаг 1: время смены (17:00-19:00). Общий для добавления и редактирования:
+# при редактировании в состоянии лежит shift_id
+@router.route("waiting_time", "time", fallback=invalid_time)
+async def shift_time_entered(message, state, match):
+    start_time, end_time = match.groups()
+    editing = "shift_id" in state
+    try:
+        to_minutes(start_time), to_minutes(end_time)
+    except ValueError:
+        await invalid_time(message, state)
+        return
+    if await reject_overlap(message, state, start_time, end_time):
+        return
+    logger.info("Time validated: %s-%s (%s)", start_time, end_time, 'edit' if editing else 'add')
 
-# Планировщик
-def run_scheduler():
-    while True:
-        ping_shift_start()  # Проверяем прямо сейчас
-        time.sleep(60)
+    user_states[message.from_user.id] = {
+        **state,
+        "stage": "waiting_username",
+        "start_time": start_time,
+        "end_time": end_time
+    }
 
+    await bot.send_message(message.chat.id,
+                           f"**{'Новое время' if editing else 'Время'}:** `{start_time}-{end_time}`\n\n"
+                           f"**Шаг 2/2:** {'Новый тег' if editing else 'Тег'} менеджера:\n"
+                           "Например: `@username`",
+                           parse_mode='MarkdownV2', reply_markup=CANCEL_MENU)
 
-# Запуск
-if __name__ == "__main__":
+
+# Шаг 2: тег менеджера (@username) — сохраняем смену
+@router.route("waiting_username", "username", fallback=invalid_username)
+async def shift_username_entered(message, state, match):
+    user_id = message.from_user.id
+    username = match.group(1)
+    interval = f"{state['start_time']}-{state['end_time']}"
+
+    # Пока вводили тег, время могли занять
+    if await reject_overlap(message, state, state["start_time"], state["end_time"]):
+        return
+
+    if "shift_id" in state:
+        shift_id = state["shift_id"]
+        shift_repo.update(shift_id, start_time=state["start_time"], end_time=state["end_time"], username=username)
+        logger.info("Shift %s updated: %s @%s", shift_id, interval, username)
+        title = f"Смена {shift_id} обновлена"
+    else:
+        new_shift = shift_repo.add(username, state["start_time"], state["end_time"], *current_team(user_id))
+        logger.info("New shift added: ID %s, %s @%s", new_shift['id'], interval, username)
+        title = "Смена добавлена"
+
+    # Очищаем состояние
+    del user_states[user_id]
+
+    await bot.send_message(message.chat.id,
+                           f"**{title}\\!**\n\n"
+                           f"`{interval}`: **@{escape_markdown_v2(username)}**",
+                           parse_mode='MarkdownV2', reply_markup=MAIN_MENU)
+
+
+# Все остальные сообщения админа: кнопки меню и шаги диалога
+@bot.message_handler(func=lambda m: m.from_user.id in settings.ADMIN_IDS)
+async def handle_admin_input(message):
+    user_id = message.from_user.id
+    state = user_states.get(user_id)
+    logger.info("Admin input from %s: '%s' | State: %s", user_id, message.text, state or 'none')
+    await router.dispatch(message, state)
+
+
+# Планировщик. При нескольких экземплярах бота он работает только у лидера;
+# правки графика с других экземпляров лидер замечает при перепроверке раз в SCHEDULER_RECHECK секунд
+lease_ttl = getattr(settings, "LEASE_TTL", LEASE_TTL)
+scheduler = ShiftScheduler(shift_repo, ping_shift_start, create_fired_log(),
+                           recheck=getattr(settings, "SCHEDULER_RECHECK", lease_ttl / 3),
+                           grace=getattr(settings, "CATCHUP_GRACE", CATCHUP_GRACE))
+elector = LeaderElector(create_lease(), scheduler.run, ttl=lease_ttl)
+
+
+# Бот, планировщик и отправка сообщений работают в одном event loop
+async def main():
     logger.info("Starting bot...")
-    scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
-    scheduler_thread.start()
+    metrics_runner = None
+    if getattr(settings, "METRICS_PORT", None):
+        metrics_runner = await metrics.start_metrics_server(getattr(settings, "METRICS_HOST", "127.0.0.1"),
+                                                            settings.METRICS_PORT)
+    outbound.start()
+    scheduler_task = asyncio.create_task(elector.run())
 
     logger.info("Bot is ready!")
-    bot.infinity_polling()
\ No newline at end of file
+    try:
+        if getattr(settings, "WEBHOOK_URL", None):
+            await run_webhook()
+        else:
+            await bot.infinity_polling()
+    finally:
+        scheduler_task.cancel()
+        await outbound.stop()
+        await bot.close_session()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+
+
+# Режим webhook: Telegram сам присылает апдейты на WEBHOOK_URL
+async def run_webhook():
+    server = WebhookServer(
+        bot,
+        host=getattr(settings, "WEBHOOK_HOST", "0.0.0.0"),
+        port=getattr(settings, "WEBHOOK_PORT", 8080),
+        path=getattr(settings, "WEBHOOK_PATH", "/webhook"),
+        secret=getattr(settings, "WEBHOOK_SECRET", None),
+        workers=getattr(settings, "WEBHOOK_WORKERS", 8)
+    )
+    await server.start()
+    await bot.set_webhook(url=settings.WEBHOOK_URL, secret_token=server.secret)
+    logger.info("Webhook set: %s", settings.WEBHOOK_URL)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+# Запуск
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
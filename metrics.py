@@ -0,0 +1,127 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from aiohttp import web
+
+# Границы корзин гистограмм, сек
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [counts по корзинам + inf, sum, count]
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        histogram[0][bisect.bisect_left(BUCKETS, value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+# Замер длительности блока; при исключении дополнительно считаем ошибку
+@contextmanager
+def timer(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        inc(name.replace("_seconds", "_errors_total"), error=getattr(e, "error_code", type(e).__name__), **labels)
+        raise
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+# Декоратор для синхронных функций и корутин
+def timed(name, **labels):
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timer(name, **labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+# Текстовый формат Prometheus
+def render_prometheus():
+    lines = []
+    with _lock:
+        for (name, labels), value in sorted(_counters.items(), key=str):
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), (counts, total, count) in sorted(_histograms.items(), key=str):
+            cumulative = 0
+            for bound, bucket_count in zip(list(BUCKETS) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+# Приблизительный перцентиль по корзинам (верхняя граница корзины)
+def _bucket_percentile(counts, count, p):
+    target = count * p
+    cumulative = 0
+    for bound, bucket_count in zip(list(BUCKETS) + [float("inf")], counts):
+        cumulative += bucket_count
+        if cumulative >= target:
+            return bound
+    return float("inf")
+
+
+# Короткая сводка для команды /metrics
+def render_summary():
+    lines = []
+    with _lock:
+        for (name, labels), (counts, total, count) in sorted(_histograms.items(), key=str):
+            label_text = ",".join(f"{k}={v}" for k, v in labels)
+            lines.append(f"{name}[{label_text}] n={count} avg={total / count * 1000:.1f}ms "
+                         f"p99<={_bucket_percentile(counts, count, 0.99) * 1000:.0f}ms")
+        for (name, labels), value in sorted(_counters.items(), key=str):
+            label_text = ",".join(f"{k}={v}" for k, v in labels)
+            lines.append(f"{name}[{label_text}] {value}")
+    return "\n".join(lines) or "no data"
+
+
+# HTTP-эндпоинт /metrics для Prometheus
+async def start_metrics_server(host, port):
+    async def handle(request):
+        return web.Response(text=render_prometheus(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,74 @@
+from telebot import types
+from intervals import shift_index
+from tools import escape_markdown_v2, cached
+
+# Сколько смен показываем на одной странице меню
+PAGE_SIZE = 10
+
+def main_menu_markup():
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.add("Добавить смену")
+    markup.add("График")
+    markup.add("Редактировать")
+    markup.add("Удалить")
+    return markup
+
+
+MAIN_MENU = main_menu_markup()
+
+SCHEDULE_MENU = types.ReplyKeyboardMarkup(resize_keyboard=True)
+SCHEDULE_MENU.add("Добавить смену", "Редактировать")
+SCHEDULE_MENU.add("График", "Удалить")
+
+CANCEL_MENU = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+CANCEL_MENU.add("Отмена")
+
+
+# Смены команды по времени начала
+def sorted_shifts(team):
+    return shift_index(team).shifts
+
+
+def render_schedule(team):
+    def build():
+        shifts = sorted_shifts(team)
+        if not shifts:
+            return "**График пуст**\n\nНажмите «Добавить смену»"
+
+        lines = ["**График дежурств:**```", f"{'Время':<12} {'Менеджер':<15}", f"{'-' * 12} {'-' * 15}"]
+        for shift in shifts:
+            time_range = f"{shift['start_time']}-{shift['end_time']}"
+            lines.append(f"{time_range:<12} @{escape_markdown_v2(shift['username']):<15}")
+        return "\n".join(lines) + "\n```"
+
+    return cached(("schedule", team), build)
+
+
+# Инлайн-клавиатура со сменами, по одной странице; action — префикс callback_data (edit / del)
+def render_shift_keyboard(team, action, page=0):
+    def build():
+        shifts = sorted_shifts(team)
+        if not shifts:
+            return None
+
+        pages = (len(shifts) + PAGE_SIZE - 1) // PAGE_SIZE
+        current = min(max(page, 0), pages - 1)
+
+        markup = types.InlineKeyboardMarkup(row_width=1)
+        for shift in shifts[current * PAGE_SIZE:(current + 1) * PAGE_SIZE]:
+            shift_text = f"{shift['start_time']}-{shift['end_time']} @{escape_markdown_v2(shift['username'])}"
+            markup.add(types.InlineKeyboardButton(shift_text, callback_data=f"{action}_{shift['id']}"))
+
+        if pages > 1:
+            nav = []
+            if current > 0:
+                nav.append(types.InlineKeyboardButton("‹", callback_data=f"page_{action}_{current - 1}"))
+            nav.append(types.InlineKeyboardButton(f"{current + 1}/{pages}", callback_data="noop"))
+            if current < pages - 1:
+                nav.append(types.InlineKeyboardButton("›", callback_data=f"page_{action}_{current + 1}"))
+            markup.row(*nav)
+
+        markup.add(types.InlineKeyboardButton("Назад", callback_data="back_admin"))
+        return markup
+
+    return cached((action, team, page), build)
@@ -0,0 +1,166 @@
+import asyncio
+import heapq
+import logging
+import metrics
+from datetime import datetime, timedelta
+from timeline import OccurrenceTimeline
+
+logger = logging.getLogger(__name__)
+
+# Как часто перепроверяем файл графика на внешние изменения, сек
+IDLE_RECHECK = 300
+# Пропущенный пинг (бот лежал, цикл опоздал) досылаем, если смена началась не раньше, сек
+CATCHUP_GRACE = 900
+
+
+# Планировщик: куча ближайших срабатываний, спим ровно до следующего.
+# Работает в event loop бота, on_fire — корутина
+class ShiftScheduler:
+    def __init__(self, repo, on_fire, fired, recheck=IDLE_RECHECK, grace=CATCHUP_GRACE):
+        self.repo = repo
+        self.on_fire = on_fire
+        self.fired = fired  # журнал отправленных пингов, общий для перезапусков и экземпляров
+        self.recheck = recheck
+        self.grace = timedelta(seconds=grace)
+        self.timeline = OccurrenceTimeline()
+        self._heap = []  # (fire_at, shift_id, generation, username)
+        self._generations = {}
+        self._watermarks = {}  # shift_id -> начало последнего отправленного повторения
+        self._running = False  # куча нужна только экземпляру, где идёт run() (лидеру)
+        self._loop = None
+        self._wakeup = None
+        self._tasks = set()
+        repo.subscribe(self.reschedule)
+
+    # Следующее повторение смены из заранее развёрнутой ленты
+    def _push(self, shift, now):
+        generation = self._generations.get(shift["id"], 0) + 1
+        self._generations[shift["id"]] = generation
+        occurrence = self.timeline.next_after(shift, now)
+        if occurrence:
+            fire_at, username = occurrence
+            heapq.heappush(self._heap, (fire_at, shift["id"], generation, username))
+
+    # Последнее начавшееся повторение, которое ещё не отправлялось и не старше grace
+    def _catch_up(self, shift, now):
+        watermark = self._watermarks.get(shift["id"])
+        occurrence = self.timeline.last_before(shift, now)
+        if watermark is None or occurrence is None:
+            return
+        fire_at, username = occurrence
+        if watermark < fire_at and now - fire_at <= self.grace:
+            logger.info("Scheduler: catching up shift %s missed at %s", shift["id"], fire_at)
+            metrics.inc("scheduler_catchups_total")
+            heapq.heappush(self._heap, (fire_at, shift["id"], self._generations[shift["id"]], username))
+
+    def _wake(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # Вызывается хранилищем при изменениях графика
+    def reschedule(self, shift_id=None):
+        if shift_id is None:
+            self.rebuild()
+            return
+
+        shift = self.repo.get(shift_id)
+        if shift:
+            now = datetime.now()
+            if shift_id not in self._watermarks:
+                # Новая смена: повторения до её создания не досылаем
+                self.fired.baseline([shift_id], now)
+                self._watermarks[shift_id] = now
+            # Таймлайн нужен и не-лидеру: по нему отвечает /now
+            self.timeline.update(shift)
+            if self._running:
+                self._push(shift, now)
+        else:
+            # Устаревшие записи в куче отбросятся по поколению
+            self.timeline.remove(shift_id)
+            self._generations[shift_id] = self._generations.get(shift_id, 0) + 1
+        self._wake()
+
+    def rebuild(self):
+        shifts = self.repo.all()
+        now = datetime.now()
+        self.timeline.rebuild(shifts)
+        if not self._running:
+            logger.info("Scheduler: timeline rebuilt: %s shifts", len(shifts))
+            return
+        self._watermarks = self.fired.load()
+        missing = [s["id"] for s in shifts if s["id"] not in self._watermarks]
+        if missing:
+            self.fired.baseline(missing, now)
+            self._watermarks.update(dict.fromkeys(missing, now))
+        self._heap = []
+        for shift in shifts:
+            self._push(shift, now)
+            self._catch_up(shift, now)
+        alive = {s["id"] for s in shifts}
+        for shift_id in list(self._generations):
+            if shift_id not in alive:
+                self._generations[shift_id] += 1
+        self._wake()
+        logger.info("Scheduler rebuilt: %s shifts", len(shifts))
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, shift_id, generation, username = heapq.heappop(self._heap)
+            if self._generations.get(shift_id) == generation:
+                due.append((fire_at, shift_id, generation, username))
+        return due
+
+    async def _fire(self, fire_at, shift_id, generation, username):
+        # Насколько позже плана реально сработали
+        metrics.observe("scheduler_lag_seconds", (datetime.now() - fire_at).total_seconds())
+        shift = self.repo.get(shift_id)
+        if not shift:
+            return
+        # Отмечаем до отправки: после перезапуска или у другого экземпляра повтора не будет,
+        # а сбои доставки разбирает очередь отправки (повторы и dead letters)
+        if self.fired.claim(shift_id, fire_at):
+            self._watermarks[shift_id] = fire_at
+            try:
+                # Менеджер этого повторения (с учётом ротации)
+                await self.on_fire({**shift, "username": username})
+            except Exception as e:
+                logger.error("Scheduler error for shift %s: %s", shift_id, e)
+        else:
+            logger.info("Scheduler: shift %s at %s already pinged", shift_id, fire_at)
+        # Если смену успели изменить, она уже перепланирована
+        if self._generations.get(shift_id) == generation:
+            self._push(shift, max(fire_at, datetime.now()))
+            self._wake()
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._running = True
+        try:
+            await self._run()
+        finally:
+            self._running = False
+            self._heap = []
+
+    async def _run(self):
+        self.rebuild()
+        while True:
+            now = datetime.now()
+            due = self._pop_due(now)
+            # Медленный ответ Telegram по одной смене не задерживает остальные
+            for item in due:
+                task = asyncio.create_task(self._fire(*item))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            timeout = self.recheck
+            if self._heap:
+                timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            # Заодно замечаем правки файла снаружи
+            self.repo.all()
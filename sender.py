@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from telebot.asyncio_helper import ApiTelegramException
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений/сек на бота, 20/мин в группу, 1/сек в личку
+GLOBAL_RATE = 30
+GROUP_RATE = 20 / 60
+PRIVATE_RATE = 1
+MAX_RETRIES = 5
+BASE_BACKOFF = 1
+MAX_BACKOFF = 60
+
+
+# Token bucket с резервированием: возвращает, сколько подождать до отправки
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+
+# Очередь исходящих сообщений: лимиты, повторы с backoff и dead-letter лог.
+# Ожидание лимита и паузы перед повтором не держат воркер: сообщение возвращается
+# в очередь по таймеру, а воркеры тем временем отправляют остальное
+class OutboundQueue:
+    def __init__(self, bot, workers=4):
+        self.bot = bot
+        self.workers = workers
+        self.dead_letter_file = getattr(settings, "DEAD_LETTER_FILE", os.path.join("logs", "dead_letter.jsonl"))
+        self._queue = asyncio.Queue()
+        self._global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self._chat_buckets = {}
+        self._tasks = []
+        self._delayed = set()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if not bucket:
+            # У групп отрицательный chat_id, у каналов — @username
+            if str(chat_id).startswith(("-", "@")):
+                bucket = TokenBucket(GROUP_RATE, 3)
+            else:
+                bucket = TokenBucket(PRIVATE_RATE, 1)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def start(self):
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        for handle in self._delayed:
+            handle.cancel()
+        self._delayed.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # Ставим сообщение в очередь; future завершится после доставки (или None при потере)
+    def send_message(self, chat_id, text, **kwargs):
+        future = asyncio.get_running_loop().create_future()
+        # (chat_id, text, kwargs, future, номер попытки, место в лимитах уже занято)
+        self._queue.put_nowait((chat_id, text, kwargs, future, 0, False))
+        return future
+
+    def _put_later(self, delay, item):
+        def put():
+            self._delayed.discard(handle)
+            self._queue.put_nowait(item)
+
+        handle = asyncio.get_running_loop().call_later(delay, put)
+        self._delayed.add(handle)
+
+    async def _worker(self):
+        while True:
+            chat_id, text, kwargs, future, attempt, reserved = await self._queue.get()
+            try:
+                if not reserved:
+                    # Место в лимитах резервируем сразу, а дожидаемся его вне воркера
+                    delay = max(self._global_bucket.reserve(), self._chat_bucket(chat_id).reserve())
+                    if delay:
+                        self._put_later(delay, (chat_id, text, kwargs, future, attempt, True))
+                        continue
+                await self._deliver(chat_id, text, kwargs, future, attempt)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Outbound worker error: %s", e)
+                if not future.done():
+                    future.set_result(None)
+            finally:
+                self._queue.task_done()
+
+    # Одна попытка отправки; при временной ошибке — повтор по таймеру
+    async def _deliver(self, chat_id, text, kwargs, future, attempt):
+        try:
+            result = await self.bot.send_message(chat_id, text, **kwargs)
+        except ApiTelegramException as e:
+            error = e
+            if e.error_code == 429:
+                delay = (e.result_json or {}).get("parameters", {}).get("retry_after", BASE_BACKOFF)
+                logger.warning("Flood limit in chat %s, retry after %ss", chat_id, delay)
+            elif e.error_code < 500:
+                # Ошибка в самом запросе (нет прав, чат не найден) — повтор не поможет
+                delay = None
+            else:
+                delay = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt)
+        except Exception as e:
+            error, delay = e, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt)
+        else:
+            if not future.done():
+                future.set_result(result)
+            return
+
+        if delay is None or attempt + 1 >= MAX_RETRIES:
+            self._dead_letter(chat_id, text, kwargs, error)
+            if not future.done():
+                future.set_result(None)
+            return
+        logger.warning("Send to %s failed (attempt %s): %s. Retry in %ss", chat_id, attempt + 1, error, delay)
+        self._put_later(delay, (chat_id, text, kwargs, future, attempt + 1, False))
+
+    def _dead_letter(self, chat_id, text, kwargs, error):
+        logger.error("Message to %s dropped: %s", chat_id, error)
+        record = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "chat_id": chat_id,
+            "text": text,
+            "kwargs": {k: v for k, v in kwargs.items() if isinstance(v, (str, int, float, bool, type(None)))},
+            "error": str(error)
+        }
+        directory = os.path.dirname(self.dead_letter_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.dead_letter_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
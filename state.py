@@ -0,0 +1,114 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from settings import settings
+
+
+# Состояния диалогов в памяти: запись живёт ttl секунд, всего не больше max_entries
+class MemoryStateStore:
+    def __init__(self, ttl=None, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if not entry:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def __setitem__(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            # Записи упорядочены по времени записи: протухшие и самые давние — в начале
+            while self._data:
+                oldest_expires, _ = next(iter(self._data.values()))
+                if len(self._data) <= self.max_entries and (oldest_expires is None or oldest_expires > time.monotonic()):
+                    break
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        with self._lock:
+            self._data.pop(key, None)
+        return value
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+
+# Состояния в SQLite: переживают перезапуск и общие для нескольких процессов бота
+class SqliteStateStore:
+    def __init__(self, path, namespace, ttl=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS states (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM states WHERE namespace = ? AND key = ?",
+                (self.namespace, str(key))
+            ).fetchone()
+        if not row:
+            return default
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            self._delete(key)
+            return default
+        return json.loads(value)
+
+    def __setitem__(self, key, value):
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO states (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, str(key), json.dumps(value, ensure_ascii=False), expires_at)
+            )
+            # Заодно вычищаем протухшие записи
+            self._conn.execute(
+                "DELETE FROM states WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                (self.namespace, now)
+            )
+
+    def _delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM states WHERE namespace = ? AND key = ?", (self.namespace, str(key)))
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        self._delete(key)
+        return value
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+
+# Хранилище состояний по настройкам: STATE_BACKEND = "memory" | "sqlite"
+def create_state_store(namespace, ttl=None):
+    if getattr(settings, "STATE_BACKEND", "memory") == "sqlite":
+        return SqliteStateStore(getattr(settings, "STATE_DB_FILE", "states.db"), namespace, ttl)
+    return MemoryStateStore(ttl)
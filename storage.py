@@ -0,0 +1,561 @@
+import json
+import logging
+import metrics
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from settings import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: остаётся только блокировка между потоками
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+# Команда смены — пара (chat_id, thread_id); старые записи относятся к чату из настроек
+def default_team():
+    return settings.GROUP_CHAT_ID, settings.THREAD_ID
+
+
+def team_of(shift):
+    return shift["chat_id"], shift["thread_id"]
+
+
+def normalize_shift(shift):
+    chat_id, thread_id = default_team()
+    shift.setdefault("chat_id", chat_id)
+    shift.setdefault("thread_id", thread_id)
+    shift.setdefault("recurrence", None)
+    return shift
+
+
+# Атомарная запись: временный файл + rename, читатели не увидят обрывок
+def write_json_atomic(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".shifts-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# Блокировка файла на время read-modify-write: между потоками (lock) и между процессами
+@contextmanager
+def locked_file(lock, path):
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        with open(path + ".lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Общая часть хранилищ: подписки на изменения графика
+class BaseShiftRepository:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._listeners = []
+        self.version = 0  # растёт при каждом изменении графика
+
+    # Подписка на изменения: listener(shift_id), None — изменился весь график
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self, shift_id=None):
+        self.version += 1
+        for listener in self._listeners:
+            listener(shift_id)
+
+    def for_team(self, chat_id, thread_id):
+        return [s for s in self.all() if team_of(s) == (chat_id, thread_id)]
+
+
+# JSON-хранилище: держим график в памяти, пишем на диск при каждом изменении
+class ShiftRepository(BaseShiftRepository):
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._shifts = {}
+        self._stamp = None
+        self._loaded = False
+        self._next_id = 1
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        # После rename меняется inode, так что правки не теряются даже в пределах одного тика mtime
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    # Перечитываем файл, только если его изменили снаружи
+    def _refresh(self):
+        stamp = self._file_stamp()
+        if self._loaded and stamp == self._stamp:
+            return False
+
+        data = []
+        if stamp is not None:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+        # Старый формат файла — просто список смен
+        if isinstance(data, list):
+            data = {"shifts": data}
+        shifts = data.get("shifts", [])
+
+        self._shifts = {s["id"]: normalize_shift(s) for s in shifts}
+        self._next_id = max(data.get("next_id", 1), max(self._shifts, default=0) + 1)
+        was_loaded = self._loaded
+        self._stamp = stamp
+        self._loaded = True
+        return was_loaded
+
+    def _flush(self):
+        write_json_atomic(self.path, {"next_id": self._next_id, "shifts": list(self._shifts.values())})
+        self._stamp = self._file_stamp()
+
+    def _write_lock(self):
+        return locked_file(self._lock, self.path)
+
+    # Проверить, не изменили ли файл снаружи; возвращает текущую версию графика
+    @metrics.timed("storage_seconds", op="read")
+    def refresh(self):
+        with self._lock:
+            changed = self._refresh()
+        if changed:
+            self._notify()
+        return self.version
+
+    @metrics.timed("storage_seconds", op="read")
+    def all(self):
+        with self._lock:
+            changed = self._refresh()
+            shifts = [dict(s) for s in self._shifts.values()]
+        if changed:
+            self._notify()
+        return shifts
+
+    @metrics.timed("storage_seconds", op="read")
+    def get(self, shift_id):
+        with self._lock:
+            changed = self._refresh()
+            shift = self._shifts.get(shift_id)
+        if changed:
+            self._notify()
+        return dict(shift) if shift else None
+
+    @metrics.timed("storage_seconds", op="write")
+    def add(self, username, start_time, end_time, chat_id, thread_id):
+        with self._write_lock():
+            changed = self._refresh()
+            new_id = self._next_id
+            self._next_id += 1
+            shift = {
+                "id": new_id,
+                "username": username,
+                "start_time": start_time,
+                "end_time": end_time,
+                "chat_id": chat_id,
+                "thread_id": thread_id,
+                "recurrence": None
+            }
+            self._shifts[new_id] = shift
+            self._flush()
+            result = dict(shift)
+        self._notify(None if changed else new_id)
+        return result
+
+    @metrics.timed("storage_seconds", op="write")
+    def update(self, shift_id, **fields):
+        with self._write_lock():
+            changed = self._refresh()
+            shift = self._shifts.get(shift_id)
+            if not shift:
+                return None
+            shift.update(fields)
+            self._flush()
+            result = dict(shift)
+        self._notify(None if changed else shift_id)
+        return result
+
+    @metrics.timed("storage_seconds", op="write")
+    def delete(self, shift_id):
+        with self._write_lock():
+            changed = self._refresh()
+            shift = self._shifts.pop(shift_id, None)
+            if not shift:
+                return None
+            self._flush()
+        self._notify(None if changed else shift_id)
+        return shift
+
+    # Полная замена графика
+    @metrics.timed("storage_seconds", op="write")
+    def replace(self, shifts):
+        with self._write_lock():
+            self._refresh()
+            self._shifts = {s["id"]: normalize_shift(dict(s)) for s in shifts}
+            self._next_id = max(self._next_id, max(self._shifts, default=0) + 1)
+            self._loaded = True
+            self._flush()
+        self._notify()
+
+    # Новый график команды целиком одной записью файла; смены других команд не трогаем
+    @metrics.timed("storage_seconds", op="write")
+    def replace_team(self, chat_id, thread_id, shifts):
+        with self._write_lock():
+            self._refresh()
+            self._shifts = {k: s for k, s in self._shifts.items() if team_of(s) != (chat_id, thread_id)}
+            result = []
+            for shift in shifts:
+                new_shift = {
+                    "id": self._next_id,
+                    "username": shift["username"],
+                    "start_time": shift["start_time"],
+                    "end_time": shift["end_time"],
+                    "chat_id": chat_id,
+                    "thread_id": thread_id,
+                    "recurrence": shift.get("recurrence")
+                }
+                self._shifts[self._next_id] = new_shift
+                self._next_id += 1
+                result.append(dict(new_shift))
+            self._flush()
+        self._notify()
+        return result
+
+
+# SQLite-хранилище: индексы по id, времени начала и команде
+class SqliteShiftRepository(BaseShiftRepository):
+    FIELDS = ("id", "username", "start_time", "end_time", "chat_id", "thread_id", "recurrence")
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS shifts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                start_time TEXT NOT NULL,
+                end_time TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_shifts_start_time ON shifts (start_time);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self._migrate()
+        self._data_version = self._read_data_version()
+
+    # Базы, созданные до появления команд: добавляем колонки и заполняем их чатом из настроек
+    def _migrate(self):
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(shifts)")}
+        if "chat_id" not in columns:
+            chat_id, thread_id = default_team()
+            self._conn.execute("ALTER TABLE shifts ADD COLUMN chat_id")
+            self._conn.execute("ALTER TABLE shifts ADD COLUMN thread_id")
+            self._conn.execute("UPDATE shifts SET chat_id = ?, thread_id = ?", (chat_id, thread_id))
+        if "recurrence" not in columns:
+            self._conn.execute("ALTER TABLE shifts ADD COLUMN recurrence TEXT")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_shifts_team ON shifts (chat_id, thread_id, start_time)"
+        )
+
+    def _read_data_version(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    # data_version меняется, когда базу правит другой процесс
+    def _changed_outside(self):
+        version = self._read_data_version()
+        changed = version != self._data_version
+        self._data_version = version
+        return changed
+
+    # Правило повторения хранится JSON-строкой
+    @staticmethod
+    def _row(row):
+        if not row:
+            return None
+        shift = dict(row)
+        shift["recurrence"] = json.loads(shift["recurrence"]) if shift["recurrence"] else None
+        return shift
+
+    @staticmethod
+    def _encode(field, value):
+        if field == "recurrence":
+            return json.dumps(value, ensure_ascii=False) if value else None
+        return value
+
+    @metrics.timed("storage_seconds", op="read")
+    def refresh(self):
+        with self._lock:
+            changed = self._changed_outside()
+        if changed:
+            self._notify()
+        return self.version
+
+    @metrics.timed("storage_seconds", op="read")
+    def all(self):
+        with self._lock:
+            changed = self._changed_outside()
+            rows = self._conn.execute("SELECT * FROM shifts ORDER BY id").fetchall()
+        if changed:
+            self._notify()
+        return [self._row(r) for r in rows]
+
+    @metrics.timed("storage_seconds", op="read")
+    def get(self, shift_id):
+        with self._lock:
+            changed = self._changed_outside()
+            row = self._conn.execute("SELECT * FROM shifts WHERE id = ?", (shift_id,)).fetchone()
+        if changed:
+            self._notify()
+        return self._row(row)
+
+    @metrics.timed("storage_seconds", op="read")
+    def for_team(self, chat_id, thread_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM shifts WHERE chat_id = ? AND thread_id IS ? ORDER BY start_time",
+                (chat_id, thread_id)
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    @metrics.timed("storage_seconds", op="write")
+    def add(self, username, start_time, end_time, chat_id, thread_id):
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO shifts (username, start_time, end_time, chat_id, thread_id) VALUES (?, ?, ?, ?, ?)",
+                (username, start_time, end_time, chat_id, thread_id)
+            )
+            new_id = cur.lastrowid
+            self._changed_outside()
+        self._notify(new_id)
+        return {
+            "id": new_id,
+            "username": username,
+            "start_time": start_time,
+            "end_time": end_time,
+            "chat_id": chat_id,
+            "thread_id": thread_id,
+            "recurrence": None
+        }
+
+    @metrics.timed("storage_seconds", op="write")
+    def update(self, shift_id, **fields):
+        fields = {k: v for k, v in fields.items() if k in self.FIELDS and k != "id"}
+        with self._lock:
+            if fields:
+                assignments = ", ".join(f"{k} = ?" for k in fields)
+                self._conn.execute(f"UPDATE shifts SET {assignments} WHERE id = ?",
+                                   (*(self._encode(k, v) for k, v in fields.items()), shift_id))
+            row = self._conn.execute("SELECT * FROM shifts WHERE id = ?", (shift_id,)).fetchone()
+            self._changed_outside()
+        if not row:
+            return None
+        self._notify(shift_id)
+        return self._row(row)
+
+    @metrics.timed("storage_seconds", op="write")
+    def delete(self, shift_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM shifts WHERE id = ?", (shift_id,)).fetchone()
+            if not row:
+                return None
+            self._conn.execute("DELETE FROM shifts WHERE id = ?", (shift_id,))
+            self._changed_outside()
+        self._notify(shift_id)
+        return self._row(row)
+
+    # Полная замена графика одной транзакцией
+    @metrics.timed("storage_seconds", op="write")
+    def replace(self, shifts):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM shifts")
+                self._conn.executemany(
+                    "INSERT INTO shifts (id, username, start_time, end_time, chat_id, thread_id, recurrence) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(s["id"], s["username"], s["start_time"], s["end_time"], *team_of(normalize_shift(dict(s))),
+                      self._encode("recurrence", s.get("recurrence")))
+                     for s in shifts]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._changed_outside()
+        self._notify()
+
+    # Новый график команды целиком одной транзакцией; смены других команд не трогаем
+    @metrics.timed("storage_seconds", op="write")
+    def replace_team(self, chat_id, thread_id, shifts):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM shifts WHERE chat_id = ? AND thread_id IS ?", (chat_id, thread_id))
+                self._conn.executemany(
+                    "INSERT INTO shifts (username, start_time, end_time, chat_id, thread_id, recurrence) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(s["username"], s["start_time"], s["end_time"], chat_id, thread_id,
+                      self._encode("recurrence", s.get("recurrence")))
+                     for s in shifts]
+                )
+                rows = self._conn.execute(
+                    "SELECT * FROM shifts WHERE chat_id = ? AND thread_id IS ? ORDER BY id", (chat_id, thread_id)
+                ).fetchall()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._changed_outside()
+        self._notify()
+        return [self._row(r) for r in rows]
+
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM shifts LIMIT 1").fetchone() is None
+
+    # Служебные отметки базы (например, что перенос из JSON уже был)
+    def get_meta(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+# Разовый перенос графика из JSON-файла в SQLite. Отметка в базе не даёт повторить его,
+# когда все смены удалили и бот перезапустился
+def import_json(json_path, repo):
+    if repo.get_meta("json_imported") or not os.path.exists(json_path):
+        return 0
+    count = 0
+    if repo.is_empty():
+        shifts = ShiftRepository(json_path).all()
+        repo.replace(shifts)
+        count = len(shifts)
+        logger.info("Imported %s shifts from %s", count, json_path)
+    repo.set_meta("json_imported", json_path)
+    return count
+
+
+# Когда каждой смене последний раз отправлен пинг (начало повторения): переживает
+# перезапуск и смену лидера, чтобы пропущенный пинг дослать, а отправленный не повторить
+class JsonFiredLog:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def load(self):
+        with self._lock:
+            return {int(k): datetime.fromisoformat(v) for k, v in self._read().items()}
+
+    # Отметка для смен, у которых её ещё нет (новые смены не досылаются задним числом)
+    @metrics.timed("storage_seconds", op="write")
+    def baseline(self, shift_ids, at):
+        with locked_file(self._lock, self.path):
+            data = self._read()
+            missing = [str(i) for i in shift_ids if str(i) not in data]
+            if missing:
+                data.update(dict.fromkeys(missing, at.isoformat(timespec="seconds")))
+                write_json_atomic(self.path, data)
+
+    # True — повторение ещё не отправлялось и теперь закреплено за вызывающим
+    @metrics.timed("storage_seconds", op="write")
+    def claim(self, shift_id, fired_at):
+        with locked_file(self._lock, self.path):
+            data = self._read()
+            last = data.get(str(shift_id))
+            if last and datetime.fromisoformat(last) >= fired_at:
+                return False
+            data[str(shift_id)] = fired_at.isoformat(timespec="seconds")
+            write_json_atomic(self.path, data)
+            return True
+
+
+class SqliteFiredLog:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS fired (
+                shift_id INTEGER PRIMARY KEY,
+                fired_at TEXT NOT NULL
+            )
+        """)
+
+    def load(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT shift_id, fired_at FROM fired").fetchall()
+        return {shift_id: datetime.fromisoformat(fired_at) for shift_id, fired_at in rows}
+
+    @metrics.timed("storage_seconds", op="write")
+    def baseline(self, shift_ids, at):
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO fired (shift_id, fired_at) VALUES (?, ?)",
+                                   [(i, at.isoformat(timespec="seconds")) for i in shift_ids])
+
+    # Сравнение и запись одним запросом: ISO-строки одного формата сравниваются как даты
+    @metrics.timed("storage_seconds", op="write")
+    def claim(self, shift_id, fired_at):
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO fired (shift_id, fired_at) VALUES (?, ?) "
+                "ON CONFLICT(shift_id) DO UPDATE SET fired_at = excluded.fired_at "
+                "WHERE fired.fired_at < excluded.fired_at",
+                (shift_id, fired_at.isoformat(timespec="seconds"))
+            )
+            return cur.rowcount == 1
+
+
+def create_fired_log():
+    if getattr(settings, "STORAGE_BACKEND", "json") == "sqlite":
+        # Отдельный файл, как и у аренды лидера: запись в базу графика меняет data_version,
+        # и каждый пинг вызывал бы полную перестройку у всех экземпляров
+        return SqliteFiredLog(getattr(settings, "FIRED_DB_FILE", getattr(settings, "DB_FILE", "shifts.db") + ".fired"))
+    return JsonFiredLog(getattr(settings, "FIRED_FILE", settings.DATA_FILE + ".fired"))
+
+
+def create_repository():
+    backend = getattr(settings, "STORAGE_BACKEND", "json")
+    if backend == "sqlite":
+        repo = SqliteShiftRepository(getattr(settings, "DB_FILE", "shifts.db"))
+        import_json(settings.DATA_FILE, repo)
+        return repo
+    return ShiftRepository(settings.DATA_FILE)
+
+
+shift_repo = create_repository()
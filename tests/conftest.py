@@ -0,0 +1,23 @@
+import os
+import sys
+import tempfile
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# settings.py с токеном и чатами в репозиторий не входит — для тестов свои настройки
+class _Settings:
+    BOT_TOKEN = "1:test"
+    GROUP_CHAT_ID = -100
+    THREAD_ID = None
+    ADMIN_IDS = [1]
+    DATA_FILE = os.path.join(tempfile.mkdtemp(prefix="bot-tests-"), "shifts.json")
+    STORAGE_BACKEND = "json"
+    STATE_BACKEND = "memory"
+    HOLIDAYS = ()
+    TIMEZONE = None
+
+
+sys.modules["settings"] = types.SimpleNamespace(settings=_Settings)
@@ -0,0 +1,84 @@
+import json
+import pytest
+from bulk import ScheduleImportError, export_schedule, parse_schedule
+
+
+def test_parse_csv_with_and_without_header():
+    expected = [
+        {"username": "anna", "start_time": "09:00", "end_time": "13:00", "recurrence": None},
+        {"username": "oleg", "start_time": "13:00", "end_time": "18:00", "recurrence": None},
+    ]
+    assert parse_schedule("start_time,end_time,username\n09:00,13:00,@anna\n13:00,18:00,oleg\n") == expected
+    assert parse_schedule("\ufeff09:00, 13:00, @anna\n\n13:00,18:00,@oleg") == expected
+
+
+def test_parse_json():
+    text = json.dumps({"shifts": [{"start_time": "22:00", "end_time": "02:00", "username": "night",
+                                   "recurrence": {"weekdays": [4, 5]}}]})
+    assert parse_schedule(text) == [{"username": "night", "start_time": "22:00", "end_time": "02:00",
+                                     "recurrence": {"weekdays": [4, 5]}}]
+
+
+def test_all_errors_reported_with_lines():
+    with pytest.raises(ScheduleImportError) as e:
+        parse_schedule("start_time,end_time,username\n25:00,26:00,@x\n09:00,10:00,@ok\n10:00,11:00,bad name\n")
+    assert [where for where, _ in e.value.errors] == [2, 4]
+
+
+def test_overlaps_within_file():
+    with pytest.raises(ScheduleImportError) as e:
+        parse_schedule("09:00,12:00,a\n11:00,13:00,b\n23:00,01:00,c\n00:30,02:00,d\n")
+    assert [where for where, _ in e.value.errors] == [2, 4]
+
+
+def test_overnight_tail_overlaps_next_day():
+    friday_night = {"start_time": "22:00", "end_time": "02:00", "username": "a", "recurrence": {"weekdays": [4]}}
+    with pytest.raises(ScheduleImportError) as e:
+        parse_schedule(json.dumps([
+            friday_night,
+            {"start_time": "00:30", "end_time": "03:00", "username": "b", "recurrence": {"weekdays": [5]}},
+        ]))
+    assert [where for where, _ in e.value.errors] == [2]
+    # Хвост понедельничной ночной смены — уже вторник
+    assert len(parse_schedule(json.dumps([
+        {**friday_night, "recurrence": {"weekdays": [0]}},
+        {"start_time": "01:00", "end_time": "03:00", "username": "b", "recurrence": {"weekdays": [0]}},
+    ]))) == 2
+
+
+def test_same_slot_on_different_weekdays():
+    text = json.dumps([
+        {"start_time": "09:00", "end_time": "12:00", "username": "a", "recurrence": {"weekdays": [0, 1, 2]}},
+        {"start_time": "09:00", "end_time": "12:00", "username": "b", "recurrence": {"weekdays": [3, 4]}},
+    ])
+    assert len(parse_schedule(text)) == 2
+
+
+@pytest.mark.parametrize("text", ["", "[]", "start_time,end_time,username\n", '{"shifts": []}', "[1, 2",
+                                  '{"shifts": 3}', '[{"start_time": "09:00", "end_time": "10:00"}]'])
+def test_rejects_empty_and_malformed(text):
+    with pytest.raises(ScheduleImportError):
+        parse_schedule(text)
+
+
+@pytest.mark.parametrize("rule", [{"timezone": "Nope/Zone"}, {"weekdays": "x"}, {"rotation": "abc"},
+                                  {"rotation_start": "z"}, "weekly"])
+def test_rejects_bad_recurrence(rule):
+    text = json.dumps([{"start_time": "09:00", "end_time": "10:00", "username": "a", "recurrence": rule}])
+    with pytest.raises(ScheduleImportError):
+        parse_schedule(text)
+
+
+def test_export_round_trip():
+    shifts = [
+        {"id": 7, "username": "anna", "start_time": "09:00", "end_time": "13:00", "chat_id": -1, "thread_id": None,
+         "recurrence": {"weekdays": [0, 1], "rotation": ["anna", "oleg"], "rotation_start": 0}},
+        {"id": 8, "username": "oleg", "start_time": "13:00", "end_time": "18:00", "chat_id": -1, "thread_id": None,
+         "recurrence": None},
+    ]
+    fields = ("username", "start_time", "end_time", "recurrence")
+    assert parse_schedule(export_schedule(shifts)) == [{k: s[k] for k in fields} for s in shifts]
+
+    csv_text = export_schedule(shifts, "csv")
+    assert csv_text.splitlines()[0] == "start_time,end_time,username"
+    assert [s["username"] for s in parse_schedule(csv_text)] == ["anna", "oleg"]
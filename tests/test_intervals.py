@@ -0,0 +1,93 @@
+from datetime import datetime
+import pytest
+from intervals import ShiftIntervalIndex, duration, segments, to_minutes
+from timeline import OccurrenceTimeline
+
+
+def shift(shift_id, start_time, end_time, weekdays=None):
+    return {
+        "id": shift_id,
+        "username": f"user{shift_id}",
+        "start_time": start_time,
+        "end_time": end_time,
+        "recurrence": {"weekdays": weekdays} if weekdays is not None else None
+    }
+
+
+def test_to_minutes():
+    assert to_minutes("00:00") == 0
+    assert to_minutes("17:30") == 17 * 60 + 30
+    for value in ("24:00", "12:60", "7"):
+        with pytest.raises(ValueError):
+            to_minutes(value)
+
+
+def test_segments():
+    assert segments("09:00", "12:00") == [(540, 720)]
+    # Ночная смена делится на два отрезка, до полуночи — на один
+    assert segments("22:00", "02:00") == [(1320, 1440), (0, 120)]
+    assert segments("22:00", "00:00") == [(1320, 1440)]
+    # Одинаковые начало и конец — круглосуточная смена
+    assert segments("08:00", "08:00") == [(0, 1440)]
+
+
+def test_duration():
+    assert duration("09:00", "12:30") == 210
+    assert duration("22:00", "02:00") == 240
+    assert duration("08:00", "08:00") == 1440
+
+
+def test_overlapping():
+    index = ShiftIntervalIndex([shift(1, "09:00", "12:00"), shift(2, "22:00", "02:00")])
+    assert index.overlapping("11:00", "13:00")["id"] == 1
+    assert index.overlapping("12:00", "13:00") is None  # касание концами — не пересечение
+    assert index.overlapping("01:00", "03:00")["id"] == 2  # хвост ночной смены после полуночи
+    assert index.overlapping("21:00", "23:00")["id"] == 2
+    assert index.overlapping("13:00", "21:00") is None
+    assert index.overlapping("10:00", "11:00", exclude_id=1) is None
+
+
+def test_overlapping_respects_weekdays():
+    index = ShiftIntervalIndex([shift(1, "09:00", "12:00", [0, 1, 2])])
+    assert index.overlapping("10:00", "11:00", weekdays=[3, 4]) is None
+    assert index.overlapping("10:00", "11:00", weekdays=[2, 3])["id"] == 1
+    assert index.overlapping("10:00", "11:00")["id"] == 1  # по умолчанию — будни
+
+
+def test_overnight_tail_belongs_to_next_day():
+    # Хвост пятничной ночной смены приходится на субботу
+    friday_night = ShiftIntervalIndex([shift(1, "22:00", "02:00", [4])])
+    assert friday_night.overlapping("00:30", "03:00", weekdays=[5])["id"] == 1
+    assert friday_night.overlapping("00:30", "03:00", weekdays=[4]) is None
+    saturday_early = ShiftIntervalIndex([shift(2, "00:30", "03:00", [5])])
+    assert saturday_early.overlapping("22:00", "02:00", weekdays=[4])["id"] == 2
+    # Хвост понедельничной — во вторник, ранней понедельничной смене он не мешает
+    monday_night = ShiftIntervalIndex([shift(1, "22:00", "02:00", [0])])
+    assert monday_night.overlapping("01:00", "03:00", weekdays=[0]) is None
+    assert ShiftIntervalIndex([shift(2, "01:00", "03:00", [0])]).overlapping("22:00", "02:00", weekdays=[0]) is None
+    # Воскресная ночная смена заходит в понедельник
+    assert ShiftIntervalIndex([shift(1, "22:00", "02:00", [6])]).overlapping("01:00", "03:00", weekdays=[0])["id"] == 1
+
+
+def test_current():
+    index = ShiftIntervalIndex([shift(1, "09:00", "12:00"), shift(2, "22:00", "02:00"), shift(3, "09:00", "12:00", [5, 6])])
+    assert [s["id"] for s in index.current(datetime(2026, 10, 19, 10, 0))] == [1]
+    assert [s["id"] for s in index.current(datetime(2026, 10, 24, 10, 0))] == [3]  # суббота
+    assert [s["id"] for s in index.current(datetime(2026, 10, 20, 1, 0))] == [2]
+    assert index.current(datetime(2026, 10, 19, 1, 0)) == []  # в воскресенье ночной смены нет
+    assert index.current(datetime(2026, 10, 19, 12, 0)) == []
+
+
+def test_previous_is_latest_occurrence_before():
+    morning = shift(1, "09:00", "12:00", [0, 1, 2, 3, 4])
+    midday = shift(2, "12:00", "15:00", [0, 1, 2])
+    evening = shift(3, "15:00", "18:00", [0, 1, 2, 3, 4])
+    index = ShiftIntervalIndex([evening, morning, midday])
+    timeline = OccurrenceTimeline(horizon_days=3)
+    monday, thursday = datetime(2026, 10, 19, 15, 0), datetime(2026, 10, 22, 15, 0)
+    assert index.previous(evening, monday, timeline) == (datetime(2026, 10, 19, 12, 0), "user2")
+    assert index.previous(evening, thursday, timeline) == (datetime(2026, 10, 22, 9, 0), "user1")
+    # Для первой смены дня — последняя смена прошлого рабочего дня, в понедельник — пятничная
+    assert index.previous(morning, datetime(2026, 10, 20, 9, 0), timeline) == (datetime(2026, 10, 19, 15, 0), "user3")
+    assert index.previous(morning, datetime(2026, 10, 19, 9, 0), timeline) == (datetime(2026, 10, 16, 15, 0), "user3")
+    assert ShiftIntervalIndex([morning]).previous(morning, monday, timeline) is None
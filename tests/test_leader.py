@@ -0,0 +1,92 @@
+import asyncio
+import leader
+from leader import FileLease, LeaderElector, SqliteLease
+
+
+def test_file_lease_is_exclusive(tmp_path):
+    path = str(tmp_path / "shifts.json.leader")
+    first, second = FileLease(path), FileLease(path)
+    assert first.acquire()
+    assert first.acquire()  # продление своей аренды
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+def test_sqlite_lease_is_exclusive(tmp_path):
+    path = str(tmp_path / "shifts.db.leader")
+    first, second = SqliteLease(path), SqliteLease(path)
+    second.holder = "other:1"
+    assert first.acquire()
+    assert first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+
+
+def test_expired_sqlite_lease_is_taken_over(tmp_path, monkeypatch):
+    path = str(tmp_path / "shifts.db.leader")
+    first, second = SqliteLease(path, ttl=15), SqliteLease(path, ttl=15)
+    second.holder = "other:1"
+    now = 1000.0
+    monkeypatch.setattr(leader.time, "time", lambda: now)
+    assert first.acquire()
+    now += 14
+    assert not second.acquire()
+    # Лидер завис и не продлевал аренду дольше ttl — её забирает другой экземпляр
+    now += 2
+    assert second.acquire()
+    assert not first.acquire()
+
+
+# Аренда, которая сначала захватывается, а затем перестаёт продлеваться (ошибка базы)
+class FlakyLease:
+    def __init__(self, results):
+        self.results = list(results)
+        self.released = False
+
+    def acquire(self):
+        result = self.results.pop(0) if self.results else False
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def release(self):
+        self.released = True
+
+
+def run_elector(lease, seconds=0.2):
+    events = []
+
+    async def work():
+        events.append("started")
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            events.append("cancelled")
+            raise
+
+    async def main():
+        task = asyncio.create_task(LeaderElector(lease, work, ttl=0.03).run())
+        await asyncio.sleep(seconds)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    return events
+
+
+def test_elector_stops_work_when_lease_check_fails():
+    lease = FlakyLease([True, True, OSError("database is locked")])
+    assert run_elector(lease) == ["started", "cancelled"]
+    assert lease.released
+
+
+def test_elector_stops_work_when_lease_is_lost():
+    lease = FlakyLease([True, False])
+    assert run_elector(lease) == ["started", "cancelled"]
+
+
+def test_follower_does_not_start_work():
+    assert run_elector(FlakyLease([False] * 10)) == []
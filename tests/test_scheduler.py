@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime
+import pytest
+import scheduler as scheduler_module
+import timeline
+from scheduler import ShiftScheduler
+from storage import JsonFiredLog, ShiftRepository, SqliteFiredLog
+
+MONDAY = datetime(2026, 10, 19)
+
+
+# Часы под управлением теста: планировщик и таймлайн берут «сейчас» отсюда
+class Clock(datetime):
+    current = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "datetime", Clock)
+    monkeypatch.setattr(timeline, "datetime", Clock)
+
+    def set_time(hours, minutes):
+        Clock.current = MONDAY.replace(hour=hours, minute=minutes)
+    return set_time
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def fired_path(request, tmp_path):
+    return request.param, str(tmp_path / "fired")
+
+
+# Один запуск бота: свой репозиторий и журнал поверх общих файлов
+class Instance:
+    def __init__(self, data_file, fired_path):
+        backend, path = fired_path
+        self.repo = ShiftRepository(data_file)
+        self.pings = []
+        self.scheduler = ShiftScheduler(self.repo, self.on_fire,
+                                        JsonFiredLog(path) if backend == "json" else SqliteFiredLog(path))
+
+    async def on_fire(self, shift):
+        self.pings.append((shift["id"], Clock.now()))
+
+    # Проход планировщика, как в начале run(): перестроить кучу и отправить всё, что пора
+    def run_once(self):
+        async def main():
+            self.scheduler._running = True
+            self.scheduler.rebuild()
+            for item in self.scheduler._pop_due(Clock.now()):
+                await self.scheduler._fire(*item)
+        asyncio.run(main())
+        return [shift_id for shift_id, _ in self.pings]
+
+
+@pytest.fixture
+def start(tmp_path, fired_path):
+    data_file = str(tmp_path / "shifts.json")
+    return lambda: Instance(data_file, fired_path)
+
+
+def test_missed_ping_is_caught_up_once(clock, start):
+    clock(8, 0)
+    shift = start().repo.add("anna", "09:00", "12:00", -1, None)
+    # Бот лежал в 09:00 и поднялся через 10 минут — пинг досылается
+    clock(9, 10)
+    assert start().run_once() == [shift["id"]]
+    # Повторный перезапуск в ту же минуту не дублирует его
+    assert start().run_once() == []
+    clock(9, 11)
+    assert start().run_once() == []
+
+
+def test_missed_ping_outside_grace_is_skipped(clock, start):
+    clock(8, 0)
+    start().repo.add("anna", "09:00", "12:00", -1, None)
+    clock(9, 16)
+    assert start().run_once() == []
+
+
+def test_ping_on_time_is_not_repeated_after_restart(clock, start):
+    clock(8, 0)
+    shift = start().repo.add("anna", "09:00", "12:00", -1, None)
+    clock(9, 0)
+    assert start().run_once() == [shift["id"]]
+    assert start().run_once() == []
+
+
+def test_new_shift_is_not_pinged_retroactively(clock, start):
+    clock(9, 5)
+    running = start()
+    running.run_once()
+    # Смена, начавшаяся до её создания, не пингуется ни сразу, ни после перезапуска
+    running.repo.add("anna", "09:00", "12:00", -1, None)
+    assert running.run_once() == []
+    clock(9, 6)
+    assert start().run_once() == []
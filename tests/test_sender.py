@@ -0,0 +1,101 @@
+import asyncio
+import json
+import time
+import pytest
+import sender
+from sender import OutboundQueue
+from settings import settings
+from telebot.asyncio_helper import ApiTelegramException
+
+
+def api_error(code, retry_after=None):
+    result_json = {"ok": False, "error_code": code, "description": f"error {code}"}
+    if retry_after is not None:
+        result_json["parameters"] = {"retry_after": retry_after}
+    return ApiTelegramException("sendMessage", None, result_json)
+
+
+# Бот, который по каждому chat_id сначала отдаёт заданные ошибки, потом отвечает успехом
+class FakeBot:
+    def __init__(self, errors=None):
+        self.errors = {chat_id: list(e) for chat_id, e in (errors or {}).items()}
+        self.calls = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append((chat_id, time.monotonic()))
+        errors = self.errors.get(chat_id)
+        if errors:
+            raise errors.pop(0)
+        return {"chat_id": chat_id, "text": text}
+
+
+@pytest.fixture(autouse=True)
+def fast_limits(monkeypatch, tmp_path):
+    monkeypatch.setattr(sender, "BASE_BACKOFF", 0.02)
+    monkeypatch.setattr(sender, "PRIVATE_RATE", 1000)
+    monkeypatch.setattr(settings, "DEAD_LETTER_FILE", str(tmp_path / "dead.jsonl"), raising=False)
+
+
+def run(bot, sends, workers=4):
+    async def main():
+        queue = OutboundQueue(bot, workers=workers)
+        queue.start()
+        try:
+            futures = [queue.send_message(chat_id, text) for chat_id, text in sends]
+            return await asyncio.wait_for(asyncio.gather(*futures), 5)
+        finally:
+            await queue.stop()
+    return asyncio.run(main())
+
+
+def dead_letters():
+    try:
+        with open(settings.DEAD_LETTER_FILE, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+    except FileNotFoundError:
+        return []
+
+
+def test_retries_server_errors_with_backoff():
+    bot = FakeBot({1: [api_error(502), api_error(500)]})
+    assert run(bot, [(1, "hi")]) == [{"chat_id": 1, "text": "hi"}]
+    times = [at for _, at in bot.calls]
+    assert len(times) == 3
+    # Пауза растёт: BASE_BACKOFF, затем вдвое больше
+    assert times[1] - times[0] >= 0.02
+    assert times[2] - times[1] >= 0.04
+    assert dead_letters() == []
+
+
+def test_honours_retry_after_without_blocking_worker():
+    bot = FakeBot({1: [api_error(429, retry_after=0.2)]})
+    results = run(bot, [(1, "first"), (2, "second")], workers=1)
+    assert [r["text"] for r in results] == ["first", "second"]
+    # Единственный воркер не спал: второй чат получил сообщение раньше повтора в первый
+    assert [chat_id for chat_id, _ in bot.calls] == [1, 2, 1]
+    assert bot.calls[2][1] - bot.calls[0][1] >= 0.2
+
+
+def test_client_error_goes_to_dead_letter_without_retry():
+    bot = FakeBot({1: [api_error(403)]})
+    assert run(bot, [(1, "hi")]) == [None]
+    assert len(bot.calls) == 1
+    [record] = dead_letters()
+    assert record["chat_id"] == 1 and record["text"] == "hi" and "403" in record["error"]
+
+
+def test_gives_up_after_max_retries():
+    bot = FakeBot({1: [api_error(500)] * sender.MAX_RETRIES})
+    assert run(bot, [(1, "hi")]) == [None]
+    assert len(bot.calls) == sender.MAX_RETRIES
+    assert len(dead_letters()) == 1
+
+
+def test_rate_limit_wait_does_not_block_worker(monkeypatch):
+    monkeypatch.setattr(sender, "PRIVATE_RATE", 5)
+    bot = FakeBot()
+    results = run(bot, [(1, "a"), (1, "b"), (2, "c")], workers=1)
+    assert [r["text"] for r in results] == ["a", "b", "c"]
+    # Второе сообщение в чат 1 ждёт токен, а чат 2 обслуживается сразу
+    assert [chat_id for chat_id, _ in bot.calls] == [1, 2, 1]
+    assert bot.calls[2][1] - bot.calls[0][1] >= 0.15
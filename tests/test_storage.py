@@ -0,0 +1,54 @@
+import json
+import multiprocessing
+import os
+from storage import ShiftRepository
+
+WORKERS = 3
+ADDS = 60
+
+
+def add_many(path, worker):
+    repo = ShiftRepository(path)
+    for i in range(ADDS):
+        repo.add(f"user{worker}_{i}", "09:00", "10:00", -1, None)
+
+
+def test_concurrent_adds_from_processes(tmp_path):
+    path = str(tmp_path / "shifts.json")
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=add_many, args=(path, n)) for n in range(WORKERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    # Ни одна запись не потерялась, id уникальны, файл цел (не обрывок)
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    ids = [s["id"] for s in data["shifts"]]
+    assert sorted(ids) == list(range(1, WORKERS * ADDS + 1))
+    assert data["next_id"] == WORKERS * ADDS + 1
+    assert len(ShiftRepository(path).all()) == WORKERS * ADDS
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_deleted_max_id_is_not_reused(tmp_path):
+    path = str(tmp_path / "shifts.json")
+    repo = ShiftRepository(path)
+    first = repo.add("a", "09:00", "10:00", -1, None)
+    second = repo.add("b", "10:00", "11:00", -1, None)
+    repo.delete(second["id"])
+
+    # И в этом же процессе, и после перезапуска
+    assert repo.add("c", "11:00", "12:00", -1, None)["id"] == second["id"] + 1
+    assert ShiftRepository(path).add("d", "12:00", "13:00", -1, None)["id"] == second["id"] + 2
+    assert first["id"] == 1
+
+
+def test_sees_writes_from_another_instance(tmp_path):
+    path = str(tmp_path / "shifts.json")
+    reader, writer = ShiftRepository(path), ShiftRepository(path)
+    assert reader.all() == []
+    shift = writer.add("a", "09:00", "10:00", -1, None)
+    assert reader.get(shift["id"])["username"] == "a"
@@ -0,0 +1,97 @@
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+import pytest
+from settings import settings
+from timeline import (OccurrenceTimeline, expand, parse_recurrence, runs_on, username_for, validate_recurrence,
+                      week_number)
+
+MONDAY = date(2026, 10, 19)
+
+
+def shift(recurrence=None, start_time="09:00"):
+    return {"id": 1, "username": "anna", "start_time": start_time, "end_time": "12:00", "recurrence": recurrence}
+
+
+def test_default_is_weekdays():
+    assert [runs_on(shift(), MONDAY + timedelta(days=i)) for i in range(7)] == [True] * 5 + [False] * 2
+
+
+def test_skip_dates_and_holidays(monkeypatch):
+    rule = {"weekdays": list(range(7)), "skip_dates": ["2026-10-20"]}
+    monkeypatch.setattr(settings, "HOLIDAYS", ("2026-10-21",))
+    assert runs_on(shift(rule), MONDAY)
+    assert not runs_on(shift(rule), MONDAY + timedelta(days=1))
+    assert not runs_on(shift(rule), MONDAY + timedelta(days=2))
+
+
+def test_rotation_by_week():
+    rule = {"rotation": ["a", "b", "c"], "rotation_start": week_number(MONDAY)}
+    weeks = [username_for(shift(rule), MONDAY + timedelta(weeks=i, days=3)) for i in range(4)]
+    assert weeks == ["a", "b", "c", "a"]
+    assert username_for(shift(), MONDAY) == "anna"
+
+
+def test_expand():
+    occurrences = expand(shift({"weekdays": [0, 2]}), datetime(2026, 10, 19, 10, 0), days=7)
+    starts = [start for start, _ in occurrences]
+    # Захватываем и вчерашний день: начатая до since смена может ещё идти
+    assert datetime(2026, 10, 19, 9, 0) in starts
+    assert datetime(2026, 10, 21, 9, 0) in starts
+    assert all(start.weekday() in (0, 2) for start in starts)
+    assert starts == sorted(starts)
+
+
+def test_expand_in_shift_timezone():
+    rule = {"weekdays": [0], "timezone": "Asia/Tokyo"}
+    starts = [start for start, _ in expand(shift(rule), datetime(2026, 10, 18, 12, 0), days=7)]
+    expected = datetime(2026, 10, 19, 9, 0, tzinfo=ZoneInfo("Asia/Tokyo")).astimezone().replace(tzinfo=None)
+    assert expected in starts
+
+
+def test_timeline_next_and_last():
+    timeline = OccurrenceTimeline(horizon_days=3)
+    monday_shift = shift({"weekdays": [0], "rotation": ["a", "b"], "rotation_start": week_number(MONDAY)})
+    # Ближайшее начало дальше горизонта — лента разворачивается заново
+    assert timeline.next_after(monday_shift, datetime(2026, 10, 20, 0, 0)) == (datetime(2026, 10, 26, 9, 0), "b")
+    assert timeline.next_after(monday_shift, datetime(2026, 10, 19, 9, 0)) == (datetime(2026, 10, 26, 9, 0), "b")
+    assert timeline.last_before(monday_shift, datetime(2026, 10, 19, 9, 30)) == (datetime(2026, 10, 19, 9, 0), "a")
+    # До начала — прошлонедельное повторение, хоть оно и раньше горизонта
+    assert timeline.last_before(monday_shift, datetime(2026, 10, 19, 8, 59)) == (datetime(2026, 10, 12, 9, 0), "b")
+
+
+def test_timeline_rolls_forward():
+    timeline = OccurrenceTimeline(horizon_days=3)
+    daily = shift({"weekdays": list(range(7))})
+    timeline.update(daily, datetime(2026, 10, 19, 12, 0))
+    # Развёртка давно позади — повторения не устаревшие, а разворачиваются заново
+    assert timeline.last_before(daily, datetime(2026, 11, 30, 10, 0)) == (datetime(2026, 11, 30, 9, 0), "anna")
+    assert timeline.next_after(daily, datetime(2026, 12, 31, 10, 0)) == (datetime(2027, 1, 1, 9, 0), "anna")
+    assert timeline.last_before(daily, datetime(2026, 10, 20, 8, 0)) == (datetime(2026, 10, 19, 9, 0), "anna")
+
+
+def test_parse_recurrence():
+    rule = parse_recurrence(["days=0-2,5", "rotate=@a,@b", "skip=2026-12-31", "tz=Europe/Moscow"], MONDAY)
+    assert rule == {"weekdays": [0, 1, 2, 5], "rotation": ["a", "b"], "rotation_start": week_number(MONDAY),
+                    "skip_dates": ["2026-12-31"], "timezone": "Europe/Moscow"}
+    assert parse_recurrence([], MONDAY) is None
+
+
+@pytest.mark.parametrize("args", [["days=9"], ["days=x"], ["tz=Nope/Zone"], ["skip=2026-13-01"],
+                                  ["skip=20261231"], ["rotate=@bad-name"], ["color=red"], ["days"]])
+def test_parse_recurrence_rejects(args):
+    with pytest.raises(ValueError):
+        parse_recurrence(args, MONDAY)
+
+
+@pytest.mark.parametrize("rule", ["daily", {"weekdays": "x"}, {"weekdays": []}, {"weekdays": [True]},
+                                  {"rotation": "abc"}, {"rotation_start": "z"}, {"skip_dates": "2026-01-01"},
+                                  {"timezone": "Nope/Zone"}, {"timezone": 3}, {"unknown": 1}])
+def test_validate_recurrence_rejects(rule):
+    with pytest.raises(ValueError):
+        validate_recurrence(rule)
+
+
+def test_validate_recurrence_accepts():
+    assert validate_recurrence(None) is None
+    rule = {"weekdays": [5, 6], "rotation": ["a"], "rotation_start": 3, "skip_dates": [], "timezone": "UTC"}
+    assert validate_recurrence(rule) == rule
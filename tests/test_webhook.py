@@ -0,0 +1,85 @@
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from webhook import WebhookServer
+
+SECRET = "s3cret"
+
+
+def update(update_id):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "test"},
+            "text": "/start"
+        }
+    }
+
+
+# Вместо бота — список полученных апдейтов
+class FakeBot:
+    def __init__(self):
+        self.updates = []
+
+    async def process_new_updates(self, updates):
+        self.updates.extend(updates)
+
+
+# Клиент Telegram: POST на webhook-путь локального сервера
+async def post_updates(server, bodies, headers=None, start_workers=False):
+    app = web.Application()
+    app.router.add_post(server.path, server.handle)
+    if start_workers:
+        for _ in range(server.workers):
+            server._tasks.append(asyncio.create_task(server._worker()))
+    async with TestClient(TestServer(app)) as client:
+        statuses = []
+        for body in bodies:
+            response = await client.post(server.path, json=body, headers=headers or {})
+            statuses.append(response.status)
+        if start_workers:
+            await server._queue.join()
+            await server.stop()
+        return statuses
+
+
+def test_updates_reach_bot():
+    bot = FakeBot()
+    server = WebhookServer(bot, secret=SECRET, workers=2)
+    statuses = asyncio.run(post_updates(server, [update(1), update(2)],
+                                        {"X-Telegram-Bot-Api-Secret-Token": SECRET}, start_workers=True))
+    assert statuses == [200, 200]
+    assert sorted(u.update_id for u in bot.updates) == [1, 2]
+
+
+def test_wrong_secret_is_forbidden():
+    bot = FakeBot()
+    server = WebhookServer(bot, secret=SECRET)
+    assert asyncio.run(post_updates(server, [update(1)], {"X-Telegram-Bot-Api-Secret-Token": "nope"})) == [403]
+    assert asyncio.run(post_updates(server, [update(1)])) == [403]
+    assert server._queue.empty()
+
+
+def test_bad_update_is_rejected():
+    server = WebhookServer(FakeBot(), secret=SECRET)
+    assert asyncio.run(post_updates(server, ["not an update"], {"X-Telegram-Bot-Api-Secret-Token": SECRET})) == [400]
+
+
+def test_full_queue_returns_503():
+    # Воркеры не запущены: первый апдейт занимает очередь, второй Telegram должен повторить
+    server = WebhookServer(FakeBot(), secret=SECRET, queue_size=1)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    assert asyncio.run(post_updates(server, [update(1), update(2)], headers)) == [200, 503]
+
+
+def test_missing_secret_is_generated():
+    bot = FakeBot()
+    server = WebhookServer(bot)
+    assert server.secret and server.secret != WebhookServer(bot).secret
+    statuses = asyncio.run(post_updates(server, [update(1)]))
+    assert statuses == [403]
+    statuses = asyncio.run(post_updates(server, [update(2)], {"X-Telegram-Bot-Api-Secret-Token": server.secret}))
+    assert statuses == [200]
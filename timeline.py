@@ -0,0 +1,216 @@
+import bisect
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from settings import settings
+from fsm import VALIDATORS
+
+# На сколько дней вперёд разворачиваем повторения
+HORIZON_DAYS = 28
+DEFAULT_WEEKDAYS = (0, 1, 2, 3, 4)  # по умолчанию смены только по будням
+LOOKAHEAD_DAYS = 366  # дальше ближайшее повторение не ищем
+
+
+# Правило повторения смены (всё необязательно):
+#   weekdays — дни недели (0 — понедельник), rotation — менеджеры по неделям,
+#   rotation_start — неделя, с которой начинается ротация, skip_dates — даты без смены,
+#   timezone — часовой пояс, в котором задано время смены
+def recurrence_of(shift):
+    return shift.get("recurrence") or {}
+
+
+def weekdays_of(shift):
+    return recurrence_of(shift).get("weekdays", DEFAULT_WEEKDAYS)
+
+
+def week_number(day):
+    # Недели от 0001-01-01 (понедельник)
+    return (day.toordinal() - 1) // 7
+
+
+def runs_on(shift, day):
+    rule = recurrence_of(shift)
+    if day.weekday() not in weekdays_of(shift):
+        return False
+    iso = day.isoformat()
+    return iso not in rule.get("skip_dates", ()) and iso not in getattr(settings, "HOLIDAYS", ())
+
+
+# Чья смена в этот день с учётом ротации
+def username_for(shift, day):
+    rule = recurrence_of(shift)
+    rotation = rule.get("rotation")
+    if not rotation:
+        return shift["username"]
+    return rotation[(week_number(day) - rule.get("rotation_start", 0)) % len(rotation)]
+
+
+def shift_timezone(shift):
+    name = recurrence_of(shift).get("timezone") or getattr(settings, "TIMEZONE", None)
+    return ZoneInfo(name) if name else None
+
+
+# Момент начала смены в этот день — в локальном времени сервера, как и datetime.now()
+def start_at(shift, day, tz):
+    hours, minutes = map(int, shift["start_time"].split(":"))
+    start = datetime(day.year, day.month, day.day, hours, minutes)
+    if tz is None:
+        return start
+    return start.replace(tzinfo=tz).astimezone().replace(tzinfo=None)
+
+
+# Все начала смены в [since, since + days) по дням её часового пояса
+def expand(shift, since, days=HORIZON_DAYS):
+    tz = shift_timezone(shift)
+    first_day = (since.astimezone(tz) if tz else since).date() - timedelta(days=1)
+    occurrences = []
+    for offset in range(days + 2):
+        day = first_day + timedelta(days=offset)
+        if runs_on(shift, day):
+            occurrences.append((start_at(shift, day, tz), username_for(shift, day)))
+    return occurrences
+
+
+RECURRENCE_KEYS = ("weekdays", "rotation", "rotation_start", "skip_dates", "timezone")
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# Проверка правила до записи (общая для /recur и импорта): испорченное правило ломало бы
+# развёртку повторений у всего планировщика. Возвращает правило, ValueError при ошибке
+def validate_recurrence(rule):
+    if rule is None:
+        return None
+    if not isinstance(rule, dict):
+        raise ValueError("recurrence must be an object")
+    unknown = sorted(set(rule) - set(RECURRENCE_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown recurrence keys: {', '.join(unknown)}")
+
+    weekdays = rule.get("weekdays", DEFAULT_WEEKDAYS)
+    if not isinstance(weekdays, (list, tuple)) or not weekdays or \
+            not all(_is_int(day) and 0 <= day < 7 for day in weekdays):
+        raise ValueError(f"Invalid weekdays: {weekdays!r}")
+
+    rotation = rule.get("rotation", [])
+    if not isinstance(rotation, list) or \
+            not all(isinstance(name, str) and VALIDATORS["username"].fullmatch(f"@{name}") for name in rotation):
+        raise ValueError(f"Invalid rotation: {rotation!r}")
+    if not _is_int(rule.get("rotation_start", 0)):
+        raise ValueError(f"Invalid rotation_start: {rule['rotation_start']!r}")
+
+    skip_dates = rule.get("skip_dates", [])
+    if not isinstance(skip_dates, list) or not all(isinstance(day, str) for day in skip_dates):
+        raise ValueError(f"Invalid skip_dates: {skip_dates!r}")
+    for day in skip_dates:
+        # runs_on сравнивает строки, поэтому только канонический YYYY-MM-DD
+        try:
+            valid = date.fromisoformat(day).isoformat() == day
+        except ValueError:
+            valid = False
+        if not valid:
+            raise ValueError(f"Invalid date: {day}")
+
+    timezone = rule.get("timezone")
+    if timezone is not None:
+        try:
+            ZoneInfo(timezone)
+        except (ZoneInfoNotFoundError, TypeError, ValueError):
+            raise ValueError(f"Unknown timezone: {timezone!r}")
+    return rule
+
+
+# Правило из аргументов команды: days=0-4 или days=0,2,4, rotate=@a,@b,
+# skip=2026-01-01,2026-01-02, tz=Europe/Moscow. ValueError при неверном значении
+def parse_recurrence(args, today):
+    rule = {}
+    for arg in args:
+        key, _, value = arg.partition("=")
+        if not value:
+            raise ValueError(f"Invalid argument: {arg}")
+        if key == "days":
+            weekdays = set()
+            for part in value.split(","):
+                first, _, last = part.partition("-")
+                weekdays.update(range(int(first), int(last or first) + 1))
+            rule["weekdays"] = sorted(weekdays)
+        elif key == "rotate":
+            rule["rotation"] = [name.lstrip("@") for name in value.split(",") if name.strip("@")]
+            rule["rotation_start"] = week_number(today)
+        elif key == "skip":
+            rule["skip_dates"] = value.split(",")
+        elif key == "tz":
+            rule["timezone"] = value
+        else:
+            raise ValueError(f"Unknown argument: {key}")
+    return validate_recurrence(rule or None)
+
+
+# Заранее развёрнутые повторения всех смен: shift_id -> отсортированные (начало, менеджер)
+class OccurrenceTimeline:
+    def __init__(self, horizon_days=HORIZON_DAYS):
+        self.horizon_days = horizon_days
+        self._starts = {}
+        self._usernames = {}
+        # Какое время покрывает развёртка смены: (с, по) — повторения в нём все известны
+        self._ranges = {}
+
+    def update(self, shift, since=None):
+        since = since or datetime.now()
+        occurrences = expand(shift, since, self.horizon_days)
+        self._starts[shift["id"]] = [start for start, _ in occurrences]
+        self._usernames[shift["id"]] = [username for _, username in occurrences]
+        # expand начинает с прошлого дня и доходит до конца последнего; берём с запасом
+        self._ranges[shift["id"]] = (since - timedelta(days=1), since + timedelta(days=self.horizon_days))
+
+    def remove(self, shift_id):
+        self._starts.pop(shift_id, None)
+        self._usernames.pop(shift_id, None)
+        self._ranges.pop(shift_id, None)
+
+    def rebuild(self, shifts):
+        self._starts = {}
+        self._usernames = {}
+        self._ranges = {}
+        now = datetime.now()
+        for shift in shifts:
+            self.update(shift, now)
+
+    # Начала смены из развёртки, покрывающей moment: вышли за неё — разворачиваем заново
+    def _covering(self, shift, moment):
+        covered = self._ranges.get(shift["id"])
+        if covered is None or not covered[0] <= moment < covered[1]:
+            self.update(shift, moment)
+        return self._starts[shift["id"]]
+
+    # Ближайшее начало строго после moment: (datetime, username) или None, если смена не повторяется
+    def next_after(self, shift, moment):
+        starts = self._covering(shift, moment)
+        i = bisect.bisect_right(starts, moment)
+        since = moment
+        while i == len(starts):
+            # Горизонт кончился — разворачиваем следующий кусок; пропуски и отпуска
+            # могут закрывать больше одного горизонта, поэтому ищем до LOOKAHEAD_DAYS
+            since += timedelta(days=self.horizon_days)
+            if since - moment > timedelta(days=LOOKAHEAD_DAYS):
+                return None
+            self.update(shift, since)
+            starts = self._starts[shift["id"]]
+            i = bisect.bisect_right(starts, moment)
+        return starts[i], self._usernames[shift["id"]][i]
+
+    # Повторение, идущее сейчас или последним начавшееся до moment (для еженедельной смены —
+    # и неделю назад). None, если за LOOKAHEAD_DAYS назад повторений не было
+    def last_before(self, shift, moment):
+        starts = self._covering(shift, moment)
+        i = bisect.bisect_right(starts, moment) - 1
+        since = moment
+        while i < 0:
+            since -= timedelta(days=self.horizon_days)
+            if moment - since > timedelta(days=LOOKAHEAD_DAYS):
+                return None
+            self.update(shift, since)
+            starts = self._starts[shift["id"]]
+            i = bisect.bisect_right(starts, moment) - 1
+        return starts[i], self._usernames[shift["id"]][i]
@@ -1,25 +1,28 @@
-import json
-import os
-from datetime import datetime
-from settings import settings
+import re
+from storage import shift_repo
 
 
-# Работа с JSON
-def load_shifts():
-    if os.path.exists(settings.DATA_FILE):
-        with open(settings.DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return []
+# Кэш производных от графика данных (тексты, клавиатуры, индексы): ключ -> (версия графика, значение)
+_cache = {}
 
 
-def save_shifts(shifts):
-    with open(settings.DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(shifts, f, ensure_ascii=False, indent=2)
+def cached(key, build):
+    version = shift_repo.refresh()
+    entry = _cache.get(key)
+    if entry and entry[0] == version:
+        return entry[1]
+    value = build()
+    _cache[key] = (version, value)
+    return value
+
+
+# Любое изменение графика сбрасывает кэш
+shift_repo.subscribe(lambda shift_id: _cache.clear())
+
+
+# Экранирует спецсимволы для Markdown (один проход регуляркой)
+MARKDOWN_V2_SPECIAL = re.compile(r'([_*\[\]()~`>#+\-=|{}.!])')
 
 
-# Экранирует спецсимволы для Markdown
 def escape_markdown_v2(text: str) -> str:
-    chars_to_escape = r'_ * [ ] ( ) ~ ` > # + - = | { } . !'.split()
-    for char in chars_to_escape:
-        text = text.replace(char, rf'\{char}')
-    return text
\ No newline at end of file
+    return MARKDOWN_V2_SPECIAL.sub(r'\\\1', text)
\ No newline at end of file
@@ -0,0 +1,75 @@
+import asyncio
+import hmac
+import logging
+import secrets
+from aiohttp import web
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+
+# Приём обновлений через webhook: HTTP-сервер кладёт апдейты в ограниченную очередь,
+# а фиксированный пул воркеров передаёт их в обычные обработчики бота
+class WebhookServer:
+    def __init__(self, bot, host="0.0.0.0", port=8080, path="/webhook", secret=None, workers=8, queue_size=1000):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.path = path
+        # Без секрета кто угодно, знающий URL, подсовывал бы боту апдейты: если он не задан,
+        # придумываем свой — main передаёт его Telegram в set_webhook
+        if not secret:
+            logger.warning("Webhook: WEBHOOK_SECRET is not set, using a random one for this process")
+            secret = secrets.token_urlsafe(32)
+        self.secret = secret
+        self.workers = workers
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks = []
+        self._runner = None
+
+    async def handle(self, request):
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token.encode(), self.secret.encode()):
+            return web.Response(status=403)
+
+        try:
+            update = types.Update.de_json(await request.json())
+        except Exception as e:
+            logger.warning("Webhook: bad update: %s", e)
+            return web.Response(status=400)
+
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram повторит доставку позже
+            logger.warning("Webhook: update queue is full")
+            return web.Response(status=503)
+        return web.Response()
+
+    async def _worker(self):
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.bot.process_new_updates([update])
+            except Exception as e:
+                logger.error("Webhook: update %s failed: %s", update.update_id, e)
+            finally:
+                self._queue.task_done()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+        logger.info("Webhook server listening on %s:%s%s", self.host, self.port, self.path)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._runner:
+            await self._runner.cleanup()